@@ -7,11 +7,33 @@ def create_app():
     
     # Load config from environment variables
     app.config.from_object('app.config.Config')
+
+    # Tokens of the athletes, refreshed when the descriptions are written
+    from .tokens import athlete_tokens
+    athlete_tokens.init_app(app)
+
+    # Outbound queue of the activity description updates. Only created when enabled: it
+    # resumes the pending writes of the previous processes and starts a worker sending them
+    if app.config['STAMP_ACTIVITY_DESCRIPTIONS']:
+        from .description_writer import DescriptionWriteQueue
+        app.extensions['description_writer'] = DescriptionWriteQueue(path=app.config['DESCRIPTION_QUEUE_PATH'])
+
+    # Sampling profiler, disabled until enabled with /api/admin/profiler
+    from .profiler import profiler
+    profiler.init_app(app)
     
     # Register blueprints
     from .routes.auth import bp as auth_bp
     from .routes.contests import bp as contests_bp
+    from .routes.stats import bp as stats_bp
+    from .routes.activities import bp as activities_bp
+    from .routes.webhooks import bp as webhooks_bp
+    from .routes.admin import bp as admin_bp
     app.register_blueprint(auth_bp)
     app.register_blueprint(contests_bp)
+    app.register_blueprint(stats_bp)
+    app.register_blueprint(activities_bp)
+    app.register_blueprint(webhooks_bp)
+    app.register_blueprint(admin_bp)
     
     return app 
\ No newline at end of file
@@ -0,0 +1,113 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+# Athlete profiles rarely change, the stats change with each new activity
+PROFILE_TTL = 3600
+STATS_TTL = 300
+# How long an expired value can still be served while it is refreshed
+STALE_TTL = 24 * 3600
+MAX_ATHLETES = 10000
+
+
+class TTLCache:
+    """
+    Bounded in-memory cache with a time to live per entry
+        - Least recently used entries are evicted above maxsize
+        - Expired entries are served while refreshed in the background (stale-while-revalidate)
+        - Hit, miss and refresh counters
+    """
+
+    def __init__(self, name: str, ttl: float, stale_ttl: float = STALE_TTL, maxsize: int = MAX_ATHLETES):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        # key -> (value, stored_at)
+        self.entries = OrderedDict()
+        self.refreshing = set()
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(
+            ["hits", "stale_hits", "misses", "refreshes", "refresh_errors", "invalidations", "evictions"], 0
+        )
+
+    def get_or_load(self, key: Hashable, loader: Callable):
+        """
+        Get a value from the cache, load it when missing.
+        An expired value is returned as is and reloaded in a background thread,
+        so only a cold miss waits for the loader.
+
+        Args:
+            key (Hashable): Key of the value, e.g. the athlete id
+            loader (Callable): Function without argument returning the value
+
+        Returns:
+            The cached or loaded value
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                age = now - entry[1]
+                if age <= self.ttl:
+                    self.counters["hits"] += 1
+                    return entry[0]
+                if age <= self.ttl + self.stale_ttl:
+                    self.counters["stale_hits"] += 1
+                    if key not in self.refreshing:
+                        self.refreshing.add(key)
+                        threading.Thread(target=self._refresh, args=(key, loader), daemon=True).start()
+                    return entry[0]
+            self.counters["misses"] += 1
+
+        value = loader()
+        self.set(key, value)
+        return value
+
+    def set(self, key: Hashable, value) -> None:
+        with self.lock:
+            self.entries[key] = (value, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.counters["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"name": self.name, "size": len(self.entries), **self.counters}
+
+    def _refresh(self, key: Hashable, loader: Callable) -> None:
+        try:
+            value = loader()
+        except Exception as e:
+            # Keep serving the stale value, the next stale hit retries
+            logging.error(f"Failed to refresh {self.name} cache entry {key}: {str(e)}")
+            with self.lock:
+                self.counters["refresh_errors"] += 1
+        else:
+            self.set(key, value)
+            with self.lock:
+                self.counters["refreshes"] += 1
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+
+athlete_profiles = TTLCache("athlete_profiles", ttl=PROFILE_TTL)
+athlete_stats = TTLCache("athlete_stats", ttl=STATS_TTL)
+
+
+def invalidate_athlete(athlete_id: int) -> None:
+    """
+        Drop the cached profile and stats of an athlete, after a webhook or a new sync
+    """
+    athlete_profiles.invalidate(athlete_id)
+    athlete_stats.invalidate(athlete_id)
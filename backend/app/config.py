@@ -3,11 +3,25 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev'
     STRAVA_CLIENT_ID = os.environ.get('STRAVA_CLIENT_ID')
     STRAVA_CLIENT_SECRET = os.environ.get('STRAVA_CLIENT_SECRET')
     FRONTEND_URL = os.environ.get('FRONTEND_URL', 'http://localhost:3000')
     STRAVA_REDIRECT_URI = f"{FRONTEND_URL}/auth/strava/callback"
+    STRAVA_WEBHOOK_VERIFY_TOKEN = os.environ.get('STRAVA_WEBHOOK_VERIFY_TOKEN')
+    # Id of the push subscription, the events of other subscriptions are rejected
+    STRAVA_WEBHOOK_SUBSCRIPTION_ID = os.environ.get('STRAVA_WEBHOOK_SUBSCRIPTION_ID')
+    # Write the contest progress in the description of the verified runs. The queue of
+    # the writes, with its worker and files, only exists when it is enabled.
+    STAMP_ACTIVITY_DESCRIPTIONS = os.environ.get('STAMP_ACTIVITY_DESCRIPTIONS') == '1'
+    # Pending description writes, one file per worker process ("{pid}" is the process id)
+    DESCRIPTION_QUEUE_PATH = os.environ.get(
+        'DESCRIPTION_QUEUE_PATH', os.path.join(BACKEND_DIR, 'description_queue.{pid}.json')
+    )
+    # Token of the /api/admin endpoints, disabled when not set
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
     SESSION_COOKIE_SECURE = True
     SESSION_COOKIE_SAMESITE = 'None'
\ No newline at end of file
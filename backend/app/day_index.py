@@ -0,0 +1,120 @@
+import threading
+from datetime import date, datetime
+from typing import Iterable, Optional
+
+
+def to_day_record(activity: dict) -> dict:
+    """
+        Keep only the fields of an activity record needed to verify a day
+    :param activity: record from get_strava_activity_record
+    :return: compact record with typed values
+    """
+    start_date_local = activity["start_date_local"]
+    if isinstance(start_date_local, str):
+        start_date_local = datetime.fromisoformat(start_date_local.replace("Z", "+00:00"))
+
+    latlng = activity.get("start_latlng")
+    return {
+        "id": activity["id"],
+        "start_date_local": start_date_local,
+        "distance": float(activity.get("distance") or 0),
+        "start_latlng": (float(latlng[0]), float(latlng[1])) if latlng else None,
+    }
+
+
+class DayIndex:
+    """
+    Class to index the runs of each athlete by local calendar day (start_date_local)
+        - Best run (longest) of each day precomputed
+        - Days already fetched from Strava, so a day without run is not fetched again
+    """
+
+    def __init__(self):
+        # athlete_id -> {day: {"runs": {activity_id: record}, "best": record}}
+        self.days = {}
+        # athlete_id -> {activity_id: day}, used when an activity is edited or deleted
+        self.activity_days = {}
+        # athlete_id -> set of the days whose activities are all indexed
+        self.covered = {}
+        self.lock = threading.Lock()
+
+    def upsert(self, athlete_id: int, activity: dict) -> None:
+        """
+        Add or replace an activity, only runs are indexed.
+
+        Args:
+            athlete_id (int): Owner of the activity
+            activity (dict): Activity record, see get_strava_activity_record
+        """
+        with self.lock:
+            self._remove(athlete_id, activity["id"])
+            if activity.get("type") != "Run":
+                return
+            record = to_day_record(activity)
+            day = record["start_date_local"].date()
+            athlete_days = self.days.setdefault(athlete_id, {})
+            entry = athlete_days.setdefault(day, {"runs": {}, "best": None})
+            entry["runs"][record["id"]] = record
+            if entry["best"] is None or record["distance"] > entry["best"]["distance"]:
+                entry["best"] = record
+            self.activity_days.setdefault(athlete_id, {})[record["id"]] = day
+
+    def remove(self, athlete_id: int, activity_id: int) -> None:
+        with self.lock:
+            self._remove(athlete_id, activity_id)
+
+    def mark_covered(self, athlete_id: int, days: Iterable[date]) -> None:
+        """
+            Record that all the activities of these days are indexed
+        """
+        with self.lock:
+            self.covered.setdefault(athlete_id, set()).update(days)
+
+    def clear_covered(self, athlete_id: int) -> None:
+        """
+            Forget the days fetched of an athlete, e.g. when an activity is uploaded
+            late, so the days without run are fetched again
+        """
+        with self.lock:
+            self.covered.pop(athlete_id, None)
+
+    def is_covered(self, athlete_id: int, day: date) -> bool:
+        return day in self.covered.get(athlete_id, ())
+
+    def find_run(self, athlete_id: int, day: date, min_distance: float, region=None) -> Optional[dict]:
+        """
+        Find a run of a day meeting the contest requirements.
+
+        Args:
+            athlete_id (int): Athlete
+            day (date): Local calendar day
+            min_distance (float): Minimal distance in meters
+            region (Region, optional): Region where the run must start
+
+        Returns:
+            dict: The best qualifying run of the day, None if there is none
+        """
+        with self.lock:
+            entry = self.days.get(athlete_id, {}).get(day)
+            if entry is None or entry["best"]["distance"] < min_distance:
+                return None
+            if region is None:
+                return entry["best"]
+            qualifying = [
+                run for run in entry["runs"].values()
+                if run["distance"] >= min_distance
+                and run["start_latlng"] and region.contains(*run["start_latlng"])
+            ]
+            return max(qualifying, key=lambda run: run["distance"], default=None)
+
+    def _remove(self, athlete_id: int, activity_id: int) -> None:
+        day = self.activity_days.get(athlete_id, {}).pop(activity_id, None)
+        if day is None:
+            return
+        athlete_days = self.days[athlete_id]
+        entry = athlete_days[day]
+        del entry["runs"][activity_id]
+        if not entry["runs"]:
+            del athlete_days[day]
+        elif entry["best"]["id"] == activity_id:
+            entry["best"] = max(entry["runs"].values(), key=lambda run: run["distance"])
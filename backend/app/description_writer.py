@@ -0,0 +1,355 @@
+import glob
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from app.strava_manager import (
+    StravaRateLimit,
+    StravaRequestError,
+    get_activity_description,
+    put_activity_description,
+    strava_rate_limit,
+)
+from app.tokens import athlete_tokens
+
+# Strava allows 200 requests per 15 minutes and 2000 per day per application. A write
+# is a read and an update of the activity, keep room for the other reads
+REQUESTS_PER_WRITE = 2
+WRITES_PER_WINDOW = 50
+WINDOW_SECONDS = 15 * 60
+WRITES_PER_DAY = 500
+DAY_SECONDS = 24 * 3600
+MAX_ATTEMPTS = 6
+BASE_BACKOFF_SECONDS = 30
+MAX_BACKOFF_SECONDS = 3600
+# Pending writes are persisted at most once per interval, by the worker
+FLUSH_INTERVAL_SECONDS = 1.0
+# Lines of the description written by BetOnRun start with it, the rest belongs to the athlete
+STAMP_PREFIX = "BetOnRun - "
+
+
+def is_transient(error: StravaRequestError) -> bool:
+    """
+        Return True when the write may succeed if retried later
+    """
+    return error.status_code is None or error.status_code == 429 or error.status_code >= 500
+
+
+def get_stamp_prefix(contest_id: int) -> str:
+    """
+        Return the start of the stamp line of a contest, e.g. "BetOnRun - 12:"
+    """
+    return f"{STAMP_PREFIX}{contest_id}:"
+
+
+def merge_stamp(description: str, contest_id: int, stamp: str) -> str:
+    """
+        Return the description with the stamp line of the contest replaced by stamp,
+        or stamp appended if there is none. The text of the athlete and the stamps
+        of the other contests are kept.
+    """
+    prefix = get_stamp_prefix(contest_id)
+    lines = [line for line in description.splitlines() if not line.startswith(prefix)]
+    while lines and not lines[-1].strip():
+        lines.pop()
+    return "\n".join(lines + [stamp]) if lines else stamp
+
+
+def put_description_stamp(athlete_id: int, activity_id: int, contest_id: int, stamp: str) -> dict:
+    """
+        Write the stamp line of a contest in the current description of an activity,
+        with an access token of the athlete refreshed if needed
+    :raise StravaRequestError: if there is no token or Strava does not answer with a 200
+    """
+    access_token = athlete_tokens.get_access_token(athlete_id)
+    description = get_activity_description(access_token, activity_id)
+    return put_activity_description(access_token, activity_id, merge_stamp(description, contest_id, stamp))
+
+
+def is_process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class DescriptionWriteQueue:
+    """
+    Outbound queue of the activity description updates
+        - Only the stamp line of a contest is written, the text of the athlete is kept
+        - Repeated updates of the same activity and contest are merged, only the latest stamp is written
+        - Writes are paced to stay within the 15 minutes and daily rate budgets, and
+          wait when the X-RateLimit headers of Strava show the limits are reached
+        - Transient failures are retried with an exponential backoff
+        - Writes store the athlete id, the access token is read from app.tokens when sent
+        - Pending writes are persisted by the worker to a JSON file per process, and reloaded
+          after a restart, with the files left by the processes which are not running anymore
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        writes_per_window: int = WRITES_PER_WINDOW,
+        window_seconds: float = WINDOW_SECONDS,
+        writes_per_day: int = WRITES_PER_DAY,
+        day_seconds: float = DAY_SECONDS,
+        send: Callable = put_description_stamp,
+        rate_limit: StravaRateLimit = strava_rate_limit,
+    ):
+        """
+        Args:
+            path (str, optional): File of the pending writes, "{pid}" is replaced by the
+                process id. Not persisted when None.
+            writes_per_window (int): Writes allowed per window
+            window_seconds (float): Duration of the rate window
+            writes_per_day (int): Writes allowed per day
+            day_seconds (float): Duration of the day, days start at multiples of it (UTC)
+            send (Callable): Function writing a stamp, (athlete_id, activity_id, contest_id, stamp)
+            rate_limit (StravaRateLimit): Usage of the Strava rate limits by the application
+        """
+        self.path_template = path
+        self.path = path.format(pid=os.getpid()) if path else None
+        self.send = send
+        self.rate_limit = rate_limit
+        self.interval = window_seconds / writes_per_window
+        self.window_seconds = window_seconds
+        self.writes_per_day = writes_per_day
+        self.day_seconds = day_seconds
+        # (activity_id, contest_id) -> pending write
+        self.pending = OrderedDict()
+        # (activity_id, contest_id) -> write being sent, persisted too in case of a crash
+        self.in_flight = {}
+        self.next_write_at = 0.0
+        # Writes sent during the current day
+        self.day = None
+        self.day_writes = 0
+        # Changes not persisted yet
+        self.dirty = False
+        self.flushed_at = 0.0
+        self.condition = threading.Condition()
+        self.worker = None
+        self.metrics = dict.fromkeys(
+            ["enqueued", "coalesced", "sent", "retried", "failed", "rate_limited"], 0
+        )
+        self.load()
+
+    def enqueue(self, athlete_id: int, activity_id: int, contest_id: int, text: str) -> None:
+        """
+        Schedule the update of the stamp line of a contest in the description of an activity.
+        A pending update of the same activity and contest is replaced by this one.
+
+        Args:
+            athlete_id (int): Owner of the activity, see app.tokens
+            activity_id (int): Activity to update
+            contest_id (int): Contest of the stamp
+            text (str): Text of the stamp, after its prefix
+        """
+        # The stamp is a single line of the description
+        stamp = " ".join([get_stamp_prefix(contest_id)] + text.splitlines())
+        key = (activity_id, contest_id)
+        with self.condition:
+            self.metrics["enqueued"] += 1
+            if key in self.pending:
+                self.metrics["coalesced"] += 1
+            self.pending[key] = {
+                "athlete_id": athlete_id,
+                "activity_id": activity_id,
+                "contest_id": contest_id,
+                "stamp": stamp,
+                "attempts": 0,
+                "next_attempt_at": 0.0,
+            }
+            self.dirty = True
+            self.condition.notify()
+        self.start()
+
+    def start(self) -> None:
+        """
+            Start the background worker if it is not running
+        """
+        with self.condition:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self.run, daemon=True)
+                self.worker.start()
+
+    def run(self) -> None:
+        while True:
+            with self.condition:
+                while not self.pending and not self.dirty:
+                    self.condition.wait()
+                now = time.time()
+                delay = self.next_delay(now) if self.pending else math.inf
+                if self.dirty:
+                    delay = min(delay, self.flushed_at + FLUSH_INTERVAL_SECONDS - now)
+                if delay > 0:
+                    self.condition.wait(timeout=delay)
+                    continue
+            self.flush()
+            self.process_next()
+
+    def next_delay(self, now: float) -> float:
+        """
+            Return the number of seconds before the next write can be sent
+        """
+        due_at = min(write["next_attempt_at"] for write in self.pending.values())
+        return max(due_at, self.next_write_at) - now
+
+    def process_next(self, now: Optional[float] = None) -> bool:
+        """
+        Send the next due write, if any and if the rate budget allows it.
+
+        Returns:
+            bool: True if a write was sent (successfully or not)
+        """
+        now = time.time() if now is None else now
+        with self.condition:
+            if now < self.next_write_at:
+                return False
+            write = next(
+                (w for w in self.pending.values() if w["next_attempt_at"] <= now), None
+            )
+            if write is None:
+                return False
+
+            # Budget of the whole application, reads included
+            delay = self.rate_limit.delay(now, REQUESTS_PER_WRITE)
+            if delay > 0:
+                self.next_write_at = now + delay
+                return False
+
+            key = (write["activity_id"], write["contest_id"])
+            del self.pending[key]
+            self.in_flight[key] = write
+            self.next_write_at = now + self.interval
+
+            # Budget of the queue, the daily limit is shared with the reads
+            day = now // self.day_seconds
+            if day != self.day:
+                self.day, self.day_writes = day, 0
+            self.day_writes += 1
+            if self.day_writes >= self.writes_per_day:
+                self.next_write_at = max(self.next_write_at, (day + 1) * self.day_seconds)
+
+        try:
+            self.send(write["athlete_id"], write["activity_id"], write["contest_id"], write["stamp"])
+        except StravaRequestError as e:
+            self.handle_failure(write, e, now)
+        except Exception as e:
+            # e.g. an unexpected answer, retried as a transient failure
+            self.handle_failure(write, StravaRequestError(f"Error: {str(e)}"), now)
+        else:
+            with self.condition:
+                self.in_flight.pop(key, None)
+                self.metrics["sent"] += 1
+                self.dirty = True
+        return True
+
+    def handle_failure(self, write: dict, error: StravaRequestError, now: float) -> None:
+        key = (write["activity_id"], write["contest_id"])
+        with self.condition:
+            self.in_flight.pop(key, None)
+            self.dirty = True
+            if error.status_code == 429:
+                # Budget exhausted (maybe by the reads), wait for the window or the day
+                # to reset according to the headers, at least for one window
+                self.metrics["rate_limited"] += 1
+                delay = self.rate_limit.delay(now, REQUESTS_PER_WRITE)
+                self.next_write_at = now + max(delay, self.window_seconds)
+                # Not the fault of the write, retried without using an attempt
+                if key not in self.pending:
+                    self.pending[key] = write
+                    self.metrics["retried"] += 1
+                return
+
+            write["attempts"] += 1
+            if not is_transient(error) or write["attempts"] >= MAX_ATTEMPTS:
+                logging.error(f"Failed to update description of activity {write['activity_id']}: {str(error)}")
+                self.metrics["failed"] += 1
+            elif key not in self.pending:
+                # Retry unless a newer stamp was enqueued meanwhile
+                backoff = min(BASE_BACKOFF_SECONDS * 2 ** (write["attempts"] - 1), MAX_BACKOFF_SECONDS)
+                write["next_attempt_at"] = now + backoff * random.uniform(0.8, 1.2)
+                self.pending[key] = write
+                self.metrics["retried"] += 1
+
+    def get_metrics(self) -> dict:
+        with self.condition:
+            return {"pending": len(self.pending), **self.metrics}
+
+    def flush(self, force: bool = False) -> None:
+        """
+            Persist the pending writes if they changed, at most once per
+            FLUSH_INTERVAL_SECONDS unless forced. The writes hold athlete ids, not tokens.
+        """
+        with self.condition:
+            now = time.time()
+            if not self.dirty or (not force and now < self.flushed_at + FLUSH_INTERVAL_SECONDS):
+                return
+            writes = list(self.in_flight.values()) + list(self.pending.values())
+            self.dirty = False
+            self.flushed_at = now
+        if not self.path:
+            return
+
+        tmp_path = f"{self.path}.tmp"
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump(writes, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.error(f"Failed to save pending description writes: {str(e)}")
+            with self.condition:
+                self.dirty = True
+
+    def load(self) -> None:
+        """
+            Load the pending writes of this process, and claim the files left by
+            the processes which are not running anymore
+        """
+        if not self.path:
+            return
+
+        prefix, _, suffix = self.path_template.partition("{pid}")
+        claimed = []
+        for path in sorted(glob.glob(self.path_template.format(pid="*"))):
+            pid = path[len(prefix):len(path) - len(suffix)]
+            if path == self.path or (pid.isdigit() and not is_process_alive(int(pid))):
+                # The rename fails if another process claimed the file first
+                claimed_path = f"{path}.{os.getpid()}.claimed"
+                try:
+                    os.rename(path, claimed_path)
+                except OSError:
+                    continue
+                claimed.append(claimed_path)
+
+        for path in claimed:
+            try:
+                with open(path) as f:
+                    writes = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.error(f"Failed to load pending description writes: {str(e)}")
+                continue
+            # Writes in flight are listed first, a newer pending write of the same key wins
+            for write in writes:
+                if not all(field in write for field in ("athlete_id", "activity_id", "contest_id", "stamp")):
+                    logging.error(f"Skip pending description write of an older format: {write.get('activity_id')}")
+                    continue
+                self.pending[(write["activity_id"], write["contest_id"])] = write
+
+        if self.pending:
+            logging.info(f"Resume {len(self.pending)} pending description writes")
+            self.dirty = True
+            self.flush(force=True)
+            self.start()
+        for path in claimed:
+            os.remove(path)
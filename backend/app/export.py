@@ -0,0 +1,230 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+EXPORT_FORMATS = ["ndjson", "csv", "parquet"]
+
+EXPORT_CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Flat columns of an exported activity, start_latlng is split in two columns
+EXPORT_COLUMNS = [
+    "id",
+    "cursor",
+    "name",
+    "start_date",
+    "start_date_local",
+    "type",
+    "distance",
+    "moving_time",
+    "elapsed_time",
+    "total_elevation_gain",
+    "elev_high",
+    "elev_low",
+    "average_speed",
+    "max_speed",
+    "average_heartrate",
+    "max_heartrate",
+    "average_cadence",
+    "start_lat",
+    "start_lng",
+]
+
+STRING_COLUMNS = ["cursor", "name", "start_date", "start_date_local", "type"]
+INTEGER_COLUMNS = ["id", "moving_time", "elapsed_time"]
+
+
+def to_utc(value: datetime) -> datetime:
+    """
+        Return an aware UTC datetime, naive datetimes are considered as UTC
+    """
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def encode_cursor(record: dict) -> str:
+    """
+        Return the cursor of an activity record, "<UTC start timestamp>:<activity id>"
+    """
+    return f"{int(to_utc(record['start_date']).timestamp())}:{record['id']}"
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """
+        Return the UTC start timestamp and the activity id of a cursor
+    :raise ValueError: if the cursor is malformed
+    """
+    timestamp, activity_id = cursor.split(":")
+    return int(timestamp), int(activity_id)
+
+
+def iter_export_records(
+    client,
+    start_date: datetime,
+    end_date: datetime,
+    types: Optional[List[str]] = None,
+    cursor: Optional[str] = None,
+) -> Iterator[dict]:
+    """
+    Iterate over the activities to export, page by page.
+
+    Args:
+        client (StravaManager): Client with the token of the athlete
+        start_date (datetime): Start of the export (UTC)
+        end_date (datetime): End of the export (UTC)
+        types (List[str], optional): Keep only these activity types
+        cursor (str, optional): Resume after the activity with this cursor
+
+    Yields:
+        dict: Activity record with its cursor
+    """
+    last = None
+    if cursor:
+        last = decode_cursor(cursor)
+        # Strava "after" is exclusive, restart one second before the cursor and
+        # skip the activities already exported
+        resume_date = datetime.fromtimestamp(last[0] - 1, timezone.utc).replace(tzinfo=None)
+        start_date = max(start_date, resume_date)
+
+    for record in client.iter_activities_between(start_date, end_date):
+        if types and str(record["type"]) not in types:
+            continue
+        if last and (int(to_utc(record["start_date"]).timestamp()), record["id"]) <= last:
+            continue
+        record["cursor"] = encode_cursor(record)
+        yield record
+
+
+def to_export_row(record: dict) -> dict:
+    """
+        Flatten an activity record into the EXPORT_COLUMNS
+    """
+    row = {}
+    for column in EXPORT_COLUMNS:
+        if column in ("start_lat", "start_lng"):
+            continue
+        value = record.get(column)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif column in STRING_COLUMNS and value is not None:
+            value = str(value)
+        elif column in INTEGER_COLUMNS and value is not None:
+            value = int(value)
+        elif value is not None:
+            value = float(value)
+        row[column] = value
+
+    latlng = record.get("start_latlng")
+    row["start_lat"] = float(latlng[0]) if latlng else None
+    row["start_lng"] = float(latlng[1]) if latlng else None
+    return row
+
+
+def iter_chunks(iterable: Iterable, size: int) -> Iterator[list]:
+    """
+        Split an iterable into lists of at most size elements
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def stream_ndjson(records: Iterable[dict]) -> Iterator[str]:
+    """
+        Stream the activities as newline delimited JSON, one activity per line
+    """
+    for record in records:
+        yield json.dumps(to_export_row(record)) + "\n"
+
+
+def stream_csv(records: Iterable[dict], chunk_size: int = 200) -> Iterator[str]:
+    """
+        Stream the activities as CSV, one chunk of rows at a time
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+
+    for chunk in iter_chunks(records, chunk_size):
+        writer.writerows(to_export_row(record) for record in chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+    # Header only when there is no activity
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+class ChunkSink:
+    """
+    Write-only file object keeping the bytes written since the last drain,
+    used to stream a Parquet file while it is written
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_parquet(records: Iterable[dict], row_group_size: int = 1000) -> Iterator[bytes]:
+    """
+        Stream the activities as a Parquet file, one row group at a time.
+        Requires pyarrow, which is an optional dependency.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [
+            (
+                column,
+                pa.string() if column in STRING_COLUMNS
+                else pa.int64() if column in INTEGER_COLUMNS
+                else pa.float64(),
+            )
+            for column in EXPORT_COLUMNS
+        ]
+    )
+
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema)
+    try:
+        for chunk in iter_chunks(records, row_group_size):
+            rows = [to_export_row(record) for record in chunk]
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
@@ -0,0 +1,316 @@
+import math
+import threading
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple
+
+EARTH_RADIUS_M = 6371008.8
+
+# Size of a grid cell in degrees, 0.01 is about 1.1 km of latitude
+ACTIVITY_CELL_DEG = 0.01
+REGION_CELL_DEG = 0.1
+
+# Largest regions and queries accepted, so a request only visits a bounded number of cells
+MAX_RADIUS_M = 100_000
+MAX_REGION_SPAN_DEG = 2.0
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """
+        Return the distance in meters between two points
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def check_point(lat: float, lng: float) -> None:
+    """
+        Raise a ValueError if a point is not a finite latitude and longitude
+    """
+    if not (math.isfinite(lat) and math.isfinite(lng)):
+        raise ValueError("lat and lng must be finite numbers")
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("lat must be between -90 and 90, lng between -180 and 180")
+
+
+def check_radius(radius_m: float) -> None:
+    """
+        Raise a ValueError if a radius is not positive or above MAX_RADIUS_M
+    """
+    if not (math.isfinite(radius_m) and 0 < radius_m <= MAX_RADIUS_M):
+        raise ValueError(f"radius must be positive and at most {MAX_RADIUS_M / 1000:.0f} km")
+
+
+def radius_bbox(lat: float, lng: float, radius_m: float) -> Tuple[float, float, float, float]:
+    """
+        Return the bounding box (min_lat, min_lng, max_lat, max_lng) of a circle
+    """
+    d_lat = math.degrees(radius_m / EARTH_RADIUS_M)
+    cos_lat = math.cos(math.radians(lat))
+    d_lng = 180.0 if cos_lat < 1e-6 else min(math.degrees(radius_m / (EARTH_RADIUS_M * cos_lat)), 180.0)
+    return lat - d_lat, lng - d_lng, lat + d_lat, lng + d_lng
+
+
+def point_segment_distance_m(
+    lat: float, lng: float, start: Tuple[float, float], end: Tuple[float, float]
+) -> float:
+    """
+        Return the distance in meters from a point to a segment, in an equirectangular
+        projection centered on the point (accurate at the scale of a region)
+    """
+    meters_per_deg = math.radians(EARTH_RADIUS_M)
+    cos_lat = math.cos(math.radians(lat))
+    x1, y1 = (start[1] - lng) * cos_lat * meters_per_deg, (start[0] - lat) * meters_per_deg
+    x2, y2 = (end[1] - lng) * cos_lat * meters_per_deg, (end[0] - lat) * meters_per_deg
+    dx, dy = x2 - x1, y2 - y1
+    length2 = dx * dx + dy * dy
+    t = 0.0 if length2 == 0 else min(max(-(x1 * dx + y1 * dy) / length2, 0.0), 1.0)
+    return math.hypot(x1 + t * dx, y1 + t * dy)
+
+
+def point_in_polygon(lat: float, lng: float, polygon: List[Tuple[float, float]]) -> bool:
+    """
+        Ray casting test of a point in a polygon given as a list of (lat, lng)
+    """
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        lat_i, lng_i = polygon[i]
+        lat_j, lng_j = polygon[j]
+        if (lat_i > lat) != (lat_j > lat) and lng < (lng_j - lng_i) * (lat - lat_i) / (lat_j - lat_i) + lng_i:
+            inside = not inside
+        j = i
+    return inside
+
+
+class Region:
+    """
+    Area where the runs of a local contest must start
+        - A circle with a center and a radius in meters
+        - Or a polygon of (lat, lng) points
+    """
+
+    __slots__ = ("center", "radius_m", "polygon")
+
+    def __init__(
+        self,
+        center: Optional[Tuple[float, float]] = None,
+        radius_m: Optional[float] = None,
+        polygon: Optional[List[Tuple[float, float]]] = None,
+    ):
+        if polygon:
+            if len(polygon) < 3:
+                raise ValueError("A region polygon needs at least 3 points")
+            self.polygon = [(float(lat), float(lng)) for lat, lng in polygon]
+            for lat, lng in self.polygon:
+                check_point(lat, lng)
+            lats = [lat for lat, _ in self.polygon]
+            lngs = [lng for _, lng in self.polygon]
+            if max(lats) - min(lats) > MAX_REGION_SPAN_DEG or max(lngs) - min(lngs) > MAX_REGION_SPAN_DEG:
+                raise ValueError(f"A region polygon must span at most {MAX_REGION_SPAN_DEG} degrees")
+            self.center = ((min(lats) + max(lats)) / 2, (min(lngs) + max(lngs)) / 2)
+            self.radius_m = None
+        elif center and radius_m:
+            self.center = (float(center[0]), float(center[1]))
+            self.radius_m = float(radius_m)
+            check_point(*self.center)
+            check_radius(self.radius_m)
+            self.polygon = None
+        else:
+            raise ValueError("A region needs a center and a radius_m, or a polygon")
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Region":
+        return cls(center=data.get("center"), radius_m=data.get("radius_m"), polygon=data.get("polygon"))
+
+    def to_dict(self) -> dict:
+        if self.polygon:
+            return {"polygon": self.polygon}
+        return {"center": self.center, "radius_m": self.radius_m}
+
+    def bbox(self) -> Tuple[float, float, float, float]:
+        if self.polygon:
+            lats = [lat for lat, _ in self.polygon]
+            lngs = [lng for _, lng in self.polygon]
+            return min(lats), min(lngs), max(lats), max(lngs)
+        return radius_bbox(self.center[0], self.center[1], self.radius_m)
+
+    def contains(self, lat: float, lng: float) -> bool:
+        if self.polygon:
+            return point_in_polygon(lat, lng, self.polygon)
+        return haversine_m(self.center[0], self.center[1], lat, lng) <= self.radius_m
+
+    def distance_m(self, lat: float, lng: float) -> float:
+        """
+            Return the distance in meters from a point to the region, 0 inside.
+            For a polygon, the distance to its closest edge.
+        """
+        if self.contains(lat, lng):
+            return 0.0
+        if self.polygon:
+            return min(
+                point_segment_distance_m(lat, lng, self.polygon[i - 1], self.polygon[i])
+                for i in range(len(self.polygon))
+            )
+        return haversine_m(self.center[0], self.center[1], lat, lng) - self.radius_m
+
+
+class GridIndex:
+    """
+    Spatial index bucketing items in a grid of cell_deg x cell_deg cells
+        - Points (activity starts) are stored in one cell
+        - Regions are stored in every cell of their bounding box
+        - Radius and polygon queries only visit the cells of the query bounding box,
+          or the occupied cells when there are fewer of them
+    """
+
+    def __init__(self, cell_deg: float):
+        self.cell_deg = cell_deg
+        # (row, col) -> {key: item}
+        self.cells: Dict[Tuple[int, int], Dict[Hashable, object]] = {}
+        # key -> cells of the item, used to remove it
+        self.item_cells: Dict[Hashable, List[Tuple[int, int]]] = {}
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.item_cells)
+
+    def cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg)
+
+    def bbox_range(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> Tuple[int, int, int, int]:
+        """
+            Return the (min_row, min_col, max_row, max_col) cells of a bounding box
+        """
+        min_row, min_col = self.cell(max(min_lat, -90.0), max(min_lng, -180.0))
+        max_row, max_col = self.cell(min(max_lat, 90.0), min(max_lng, 180.0))
+        return min_row, min_col, max_row, max_col
+
+    def bbox_cells(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> Iterator[Tuple[int, int]]:
+        min_row, min_col, max_row, max_col = self.bbox_range(min_lat, min_lng, max_lat, max_lng)
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                yield row, col
+
+    def insert(self, key: Hashable, item, bbox: Tuple[float, float, float, float]) -> None:
+        """
+            Insert an item in the cells of its bounding box, replacing the previous one with the same key
+        """
+        with self.lock:
+            self._remove(key)
+            cells = list(self.bbox_cells(*bbox))
+            for cell in cells:
+                self.cells.setdefault(cell, {})[key] = item
+            self.item_cells[key] = cells
+
+    def insert_point(self, key: Hashable, lat: float, lng: float, item=None) -> None:
+        self.insert(key, (lat, lng) if item is None else item, (lat, lng, lat, lng))
+
+    def remove(self, key: Hashable) -> None:
+        with self.lock:
+            self._remove(key)
+
+    def candidates(self, bbox: Tuple[float, float, float, float]) -> Dict[Hashable, object]:
+        """
+            Return the items stored in the cells overlapping a bounding box
+        """
+        found = {}
+        min_row, min_col, max_row, max_col = self.bbox_range(*bbox)
+        n_cells = (max_row - min_row + 1) * (max_col - min_col + 1)
+        with self.lock:
+            if n_cells > len(self.cells):
+                # Large box over a sparse grid: visit the occupied cells only
+                for (row, col), bucket in self.cells.items():
+                    if min_row <= row <= max_row and min_col <= col <= max_col:
+                        found.update(bucket)
+            else:
+                for cell in self.bbox_cells(*bbox):
+                    bucket = self.cells.get(cell)
+                    if bucket:
+                        found.update(bucket)
+        return found
+
+    def _remove(self, key: Hashable) -> None:
+        for cell in self.item_cells.pop(key, []):
+            bucket = self.cells[cell]
+            del bucket[key]
+            if not bucket:
+                del self.cells[cell]
+
+
+class ActivityLocationIndex:
+    """
+    Index of the start coordinates of the cached activities
+        - One grid per athlete, a query only visits the activities of its athlete
+        - Radius and polygon (region) queries
+    """
+
+    def __init__(self, cell_deg: float = ACTIVITY_CELL_DEG):
+        self.cell_deg = cell_deg
+        # athlete_id -> GridIndex of the activities
+        self.grids: Dict[int, GridIndex] = {}
+        self.lock = threading.Lock()
+
+    def upsert(self, athlete_id: int, activity: dict) -> None:
+        latlng = activity.get("start_latlng")
+        lat, lng = (float(latlng[0]), float(latlng[1])) if latlng else (math.nan, math.nan)
+        if not (math.isfinite(lat) and math.isfinite(lng)):
+            self.remove(athlete_id, activity["id"])
+            return
+        with self.lock:
+            grid = self.grids.get(athlete_id)
+            if grid is None:
+                grid = self.grids[athlete_id] = GridIndex(self.cell_deg)
+        grid.insert_point(activity["id"], lat, lng)
+
+    def remove(self, athlete_id: int, activity_id: int) -> None:
+        grid = self.grids.get(athlete_id)
+        if grid is not None:
+            grid.remove(activity_id)
+
+    def within_radius(self, athlete_id: int, lat: float, lng: float, radius_m: float) -> List[int]:
+        """
+            Return the ids of the activities of an athlete starting within radius_m
+        """
+        return self.within_region(athlete_id, Region(center=(lat, lng), radius_m=radius_m))
+
+    def within_region(self, athlete_id: int, region: Region) -> List[int]:
+        """
+            Return the ids of the activities of an athlete starting inside a region
+        """
+        grid = self.grids.get(athlete_id)
+        if grid is None:
+            return []
+        return [
+            activity_id for activity_id, (lat, lng) in grid.candidates(region.bbox()).items()
+            if region.contains(lat, lng)
+        ]
+
+
+class RegionIndex:
+    """
+    Index of the regions of the local contests, used for "contests near me"
+    """
+
+    def __init__(self, cell_deg: float = REGION_CELL_DEG):
+        self.grid = GridIndex(cell_deg)
+
+    def upsert(self, key: Hashable, region: Region) -> None:
+        self.grid.insert(key, region, region.bbox())
+
+    def remove(self, key: Hashable) -> None:
+        self.grid.remove(key)
+
+    def near(self, lat: float, lng: float, radius_m: float) -> List[Tuple[Hashable, float]]:
+        """
+            Return the (key, distance in meters) of the regions within radius_m of a point, closest first
+        """
+        check_point(lat, lng)
+        check_radius(radius_m)
+        found = []
+        for key, region in self.grid.candidates(radius_bbox(lat, lng, radius_m)).items():
+            distance = region.distance_m(lat, lng)
+            if distance <= radius_m:
+                found.append((key, distance))
+        return sorted(found, key=lambda item: item[1])
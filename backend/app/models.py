@@ -0,0 +1,227 @@
+import json
+from datetime import datetime
+from typing import List, Optional
+
+
+class Schedule:
+    """
+    Schedule of a contest
+        - Daily or weekly running days with the distance in km
+        - Bitmap of the required days, see app.schedule
+    """
+
+    __slots__ = ("type", "days", "distance", "time", "timezone", "activity", "required_mask")
+
+    def __init__(
+        self,
+        type: str,
+        distance: float,
+        days: Optional[List[str]] = None,
+        time: Optional[str] = None,
+        timezone: Optional[str] = None,
+        activity: Optional[str] = None,
+        required_mask: int = 0,
+    ):
+        self.type = type
+        self.distance = distance
+        self.days = days or []
+        self.time = time
+        self.timezone = timezone
+        self.activity = activity
+        self.required_mask = required_mask
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Schedule":
+        return cls(**{key: data[key] for key in cls.__slots__ if key in data})
+
+    def to_dict(self) -> dict:
+        data = {
+            "type": self.type,
+            "days": self.days,
+            "distance": self.distance,
+            "required_mask": self.required_mask,
+        }
+        for key in ("time", "timezone", "activity"):
+            value = getattr(self, key)
+            if value is not None:
+                data[key] = value
+        return data
+
+
+# Compact JSON encoder, shared so it is not created for each encoding
+JSON_ENCODER = json.JSONEncoder(separators=(",", ":"))
+
+
+class Participant:
+    """
+    Participant of a contest, the settlement fields are set once the contest is settled.
+    The JSON encoding is cached until one of the fields is set.
+    """
+
+    FIELDS = (
+        "id",
+        "name",
+        "paid",
+        "completed_days",
+        "completed_mask",
+        "last_verified",
+        "strava_connected",
+        "missed_days",
+        "completion_pct",
+        "passed",
+    )
+
+    __slots__ = FIELDS + ("encoded",)
+
+    def __init__(self, id: int, name: str):
+        self.id = id
+        self.name = name
+        self.paid = False
+        self.completed_days = 0
+        self.completed_mask = 0
+        self.last_verified = None
+        self.strava_connected = False
+        self.missed_days = None
+        self.completion_pct = None
+        self.passed = None
+
+    def __setattr__(self, name, value) -> None:
+        object.__setattr__(self, name, value)
+        if name != "encoded":
+            object.__setattr__(self, "encoded", None)
+
+    @classmethod
+    def from_athlete(cls, athlete: dict) -> "Participant":
+        """
+            Create the participant of the athlete stored in the session
+        """
+        return cls(id=athlete["id"], name=f"{athlete['firstname']} {athlete['lastname']}")
+
+    def to_dict(self) -> dict:
+        return {key: getattr(self, key) for key in self.FIELDS}
+
+    def to_json(self) -> bytes:
+        """
+            Return the JSON encoding of the participant, cached until a field is set
+        """
+        if self.encoded is None:
+            self.encoded = JSON_ENCODER.encode(self.to_dict()).encode()
+        return self.encoded
+
+
+def encode_participants(participants: List[Participant]) -> None:
+    """
+        Fill the cached JSON encoding of the participants which changed. Many
+        participants (e.g. after a settlement) are encoded in a single call, the
+        list is then split between the objects: a "},{"id":" can not appear in a
+        value, the quotes of the strings are escaped.
+    """
+    changed = [p for p in participants if p.encoded is None]
+    if len(changed) < 8:
+        for participant in changed:
+            participant.to_json()
+        return
+
+    encoded = JSON_ENCODER.encode([p.to_dict() for p in changed]).encode()
+    parts = encoded[len(b'[{"id":'):-len(b"}]")].split(b'},{"id":')
+    if len(parts) != len(changed):
+        raise ValueError("Unexpected encoding of the participants")
+    for participant, part in zip(changed, parts):
+        participant.encoded = b'{"id":' + part + b"}"
+
+
+class Contest:
+    """
+    Contest with its schedule and participants.
+    The JSON encoding of the contest fields is cached until the contest is modified,
+    call touch() after any change. The participants cache their own encoding, so
+    a change re-encodes the changed participants only.
+    """
+
+    __slots__ = (
+        "id",
+        "creator_id",
+        "title",
+        "stake_amount",
+        "start_date",
+        "end_date",
+        "schedule",
+        "participants",
+        "status",
+        "region",
+        "encoded",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        creator_id: int,
+        title: str,
+        stake_amount: float,
+        start_date: datetime,
+        end_date: datetime,
+        schedule: Schedule,
+        participants: Optional[List[Participant]] = None,
+        status: str = "pending",
+        region=None,
+    ):
+        self.id = id
+        self.creator_id = creator_id
+        self.title = title
+        self.stake_amount = stake_amount
+        self.start_date = start_date
+        self.end_date = end_date
+        self.schedule = schedule
+        self.participants = participants or []
+        self.status = status
+        # Region where the runs must start, see app.geo.Region, None if not a local contest
+        self.region = region
+        self.encoded = None
+
+    def touch(self) -> None:
+        """
+            Invalidate the cached JSON encoding
+        """
+        self.encoded = None
+
+    def get_participant(self, athlete_id: int) -> Optional[Participant]:
+        return next((p for p in self.participants if p.id == athlete_id), None)
+
+    def has_participant(self, athlete_id: int) -> bool:
+        return any(p.id == athlete_id for p in self.participants)
+
+    def add_participant(self, participant: Participant) -> None:
+        self.participants.append(participant)
+        self.touch()
+
+    def to_dict(self, participants: bool = True) -> dict:
+        data = {
+            "id": self.id,
+            "creator_id": self.creator_id,
+            "title": self.title,
+            "stake_amount": self.stake_amount,
+            "start_date": self.start_date.isoformat(),
+            "end_date": self.end_date.isoformat(),
+            "schedule": self.schedule.to_dict(),
+            "status": self.status,
+        }
+        if self.region is not None:
+            data["region"] = self.region.to_dict()
+        if participants:
+            data["participants"] = [p.to_dict() for p in self.participants]
+        return data
+
+    def to_json(self) -> bytes:
+        """
+            Return the JSON encoding of the contest, with the participants last
+        """
+        if self.encoded is None:
+            # Encoding of the contest fields without its closing brace, cached until the next touch()
+            self.encoded = JSON_ENCODER.encode(self.to_dict(participants=False)).encode()[:-1]
+        encode_participants(self.participants)
+        return b"".join((
+            self.encoded,
+            b',"participants":[',
+            b",".join([p.encoded for p in self.participants]),
+            b"]}",
+        ))
@@ -0,0 +1,198 @@
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Iterable, Optional
+
+# A sample whose innermost frame is in one of these modules is blocked on the network,
+# i.e. waiting on an upstream (Strava) call. Parsing in requests or stravalib is CPU.
+IO_MODULE_PREFIXES = ("socket", "ssl", "selectors", "select", "urllib3.util.wait")
+
+DEFAULT_INTERVAL = 0.01
+MAX_STACK_DEPTH = 128
+
+
+def frame_name(frame) -> str:
+    return f"{frame.f_code.co_name} ({frame.f_globals.get('__name__', '?')}:{frame.f_lineno})"
+
+
+def is_io_module(module: str) -> bool:
+    return any(module == prefix or module.startswith(prefix + ".") for prefix in IO_MODULE_PREFIXES)
+
+
+class SamplingProfiler:
+    """
+    Opt-in sampling profiler of the requests
+        - Enabled at runtime for a fraction of the requests, optionally filtered by blueprint or endpoint
+        - A background thread samples the stacks of the profiled requests
+        - Stacks are aggregated per endpoint, split between upstream I/O and CPU
+        - Report in the folded format of flamegraph.pl / speedscope
+        - The state is per process: with several workers, each one is configured
+          and reports separately
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.interval = DEFAULT_INTERVAL
+        self.endpoints = set()
+        self.blueprints = set()
+        # thread ident -> endpoint of the request being profiled
+        self.active = {}
+        # endpoint -> Counter of folded stacks
+        self.stacks = {}
+        # endpoint -> {"requests", "samples", "io_samples", "cpu_samples"}
+        self.totals = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def init_app(self, app) -> None:
+        """
+            Register the request hooks on a Flask app
+        """
+        from flask import request
+
+        @app.before_request
+        def start_profiling():
+            if self.should_sample(request.endpoint, request.blueprint):
+                self.start_request(request.endpoint)
+
+        @app.teardown_request
+        def stop_profiling(exception=None):
+            self.end_request()
+
+    def configure(
+        self,
+        enabled: bool,
+        sample_rate: float = 0.1,
+        endpoints: Iterable[str] = (),
+        blueprints: Iterable[str] = (),
+        interval: float = DEFAULT_INTERVAL,
+    ) -> None:
+        """
+        Enable or disable the profiler.
+
+        Args:
+            enabled (bool): Profile the requests
+            sample_rate (float): Fraction of the requests profiled, between 0 and 1
+            endpoints (Iterable[str]): Profile only these endpoints, e.g. "contests.verify_run"
+            blueprints (Iterable[str]): Profile only the endpoints of these blueprints
+            interval (float): Seconds between two samples
+        """
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("sample_rate must be between 0 and 1")
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+
+        with self.lock:
+            self.enabled = enabled
+            self.sample_rate = sample_rate
+            self.endpoints = set(endpoints)
+            self.blueprints = set(blueprints)
+            self.interval = interval
+            if not enabled:
+                self.active.clear()
+            elif self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.stacks.clear()
+            self.totals.clear()
+
+    def should_sample(self, endpoint: Optional[str], blueprint: Optional[str]) -> bool:
+        if not self.enabled or endpoint is None:
+            return False
+        if self.endpoints or self.blueprints:
+            if endpoint not in self.endpoints and blueprint not in self.blueprints:
+                return False
+        return random.random() < self.sample_rate
+
+    def start_request(self, endpoint: str) -> None:
+        with self.lock:
+            self.active[threading.get_ident()] = endpoint
+            self.endpoint_totals(endpoint)["requests"] += 1
+
+    def end_request(self) -> None:
+        if self.active:
+            with self.lock:
+                self.active.pop(threading.get_ident(), None)
+
+    def endpoint_totals(self, endpoint: str) -> dict:
+        return self.totals.setdefault(
+            endpoint, {"requests": 0, "samples": 0, "io_samples": 0, "cpu_samples": 0}
+        )
+
+    def run(self) -> None:
+        while self.enabled:
+            time.sleep(self.interval)
+            if self.active:
+                self.sample()
+
+    def sample(self) -> None:
+        """
+            Take one sample of the stack of every profiled request
+        """
+        frames = sys._current_frames()
+        with self.lock:
+            for ident, endpoint in list(self.active.items()):
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+
+                # Classified by the innermost frame
+                io = is_io_module(frame.f_globals.get("__name__", ""))
+                names = []
+                while frame is not None and len(names) < MAX_STACK_DEPTH:
+                    names.append(frame_name(frame))
+                    frame = frame.f_back
+
+                category = "[upstream-io]" if io else "[cpu]"
+                folded = ";".join([endpoint, category] + names[::-1])
+                self.stacks.setdefault(endpoint, Counter())[folded] += 1
+
+                totals = self.endpoint_totals(endpoint)
+                totals["samples"] += 1
+                totals["io_samples" if io else "cpu_samples"] += 1
+
+    def summary(self) -> dict:
+        """
+            Return the configuration and, per endpoint, the profiled requests and the
+            estimated upstream I/O and CPU time
+        """
+        with self.lock:
+            return {
+                "pid": os.getpid(),
+                "enabled": self.enabled,
+                "sample_rate": self.sample_rate,
+                "interval": self.interval,
+                "endpoints": sorted(self.endpoints),
+                "blueprints": sorted(self.blueprints),
+                "report": {
+                    endpoint: {
+                        **totals,
+                        "io_ms": totals["io_samples"] * self.interval * 1e3,
+                        "cpu_ms": totals["cpu_samples"] * self.interval * 1e3,
+                    }
+                    for endpoint, totals in self.totals.items()
+                },
+            }
+
+    def folded(self, endpoint: Optional[str] = None) -> str:
+        """
+            Return the stacks in the folded format, one "frame;frame;... count" per line
+        """
+        with self.lock:
+            lines = [
+                f"{stack} {count}"
+                for name, stacks in self.stacks.items()
+                if endpoint is None or name == endpoint
+                for stack, count in stacks.most_common()
+            ]
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,217 @@
+import threading
+from datetime import datetime, date, timezone
+from typing import Dict, Iterable, List, Optional
+
+from app.schedule import WEEKDAYS
+
+PERIODS = ["day", "week", "month", "year", "weekday"]
+
+TOTAL_FIELDS = ["count", "distance", "moving_time", "total_elevation_gain"]
+
+
+def get_period_keys(start_date_local: datetime) -> Dict[str, str]:
+    """
+        Return the rollup key of an activity for every period
+    :param start_date_local: local start date of the activity
+    :return: dictionary period -> key, e.g. {"month": "2024-03", "weekday": "2024-Monday"}
+    """
+    iso_year, iso_week, _ = start_date_local.isocalendar()
+    return {
+        "day": start_date_local.strftime("%Y-%m-%d"),
+        "week": f"{iso_year}-W{iso_week:02}",
+        "month": start_date_local.strftime("%Y-%m"),
+        "year": start_date_local.strftime("%Y"),
+        "weekday": f"{start_date_local.year}-{start_date_local.strftime('%A')}",
+    }
+
+
+def to_rollup_record(activity: dict) -> dict:
+    """
+        Keep only the fields of an activity record needed by the rollups
+    :param activity: record from get_strava_activity_record
+    :return: compact record with typed values
+    """
+    start_date_local = activity["start_date_local"]
+    if isinstance(start_date_local, str):
+        start_date_local = datetime.fromisoformat(start_date_local.replace("Z", "+00:00"))
+
+    return {
+        "id": activity["id"],
+        "type": activity.get("type"),
+        "start_date_local": start_date_local,
+        "distance": float(activity.get("distance") or 0),
+        "moving_time": int(activity.get("moving_time") or 0),
+        "total_elevation_gain": float(activity.get("total_elevation_gain") or 0),
+    }
+
+
+def get_sort_key(period: str, key: str):
+    """
+        Return the sort key of a rollup key, the days of the week are sorted from Monday
+    """
+    if period == "weekday":
+        year, day_name = key.split("-", 1)
+        return year, WEEKDAYS.index(day_name.lower())
+    return key
+
+
+class ActivityRollups:
+    """
+    Class to keep pre-aggregated totals of the runs of each athlete
+        - Daily, weekly, monthly, yearly and day of the week totals
+        - Incremental update when an activity is added, edited or deleted
+        - Activities changed on Strava but not fetched yet are tracked, their years are reported as stale
+        - Constant-time read of the totals for the dashboards
+    """
+
+    def __init__(self):
+        # athlete_id -> {activity_id: rollup record}
+        self.activities = {}
+        # athlete_id -> {period: {key: totals}}
+        self.totals = {}
+        # athlete_id -> {activity_id: years the changed activity may belong to}
+        self.stale = {}
+        self.lock = threading.Lock()
+
+    def upsert(self, athlete_id: int, activity: dict) -> None:
+        """
+        Add or replace an activity in the rollups of an athlete.
+        The contribution of the previous version of the activity is removed first.
+
+        Args:
+            athlete_id (int): Owner of the activity
+            activity (dict): Activity record, see get_strava_activity_record
+        """
+        record = to_rollup_record(activity)
+        with self.lock:
+            # The fetched activity is up to date
+            self.stale.get(athlete_id, {}).pop(record["id"], None)
+            athlete_activities = self.activities.setdefault(athlete_id, {})
+            previous = athlete_activities.get(record["id"])
+            if previous is not None:
+                self._apply(athlete_id, previous, sign=-1)
+            athlete_activities[record["id"]] = record
+            self._apply(athlete_id, record, sign=1)
+
+    def remove(self, athlete_id: int, activity_id: int) -> bool:
+        """
+        Remove an activity from the rollups of an athlete.
+
+        Returns:
+            bool: True if the activity was known, False otherwise
+        """
+        with self.lock:
+            self.stale.get(athlete_id, {}).pop(activity_id, None)
+            previous = self.activities.get(athlete_id, {}).pop(activity_id, None)
+            if previous is None:
+                return False
+            self._apply(athlete_id, previous, sign=-1)
+            return True
+
+    def mark_stale(self, athlete_id: int, activity_id: int, event_time: Optional[int] = None) -> None:
+        """
+        Record that an activity was created or edited on Strava. Its details are
+        not known until it is fetched (upsert) or its years are synced (reconcile),
+        meanwhile the years it may belong to are stale.
+
+        Args:
+            athlete_id (int): Owner of the activity
+            activity_id (int): Activity created or edited
+            event_time (int, optional): Epoch of the change, for a new activity
+        """
+        with self.lock:
+            years = self.stale.setdefault(athlete_id, {}).setdefault(activity_id, set())
+            previous = self.activities.get(athlete_id, {}).get(activity_id)
+            if previous is not None:
+                years.add(previous["start_date_local"].year)
+            if event_time is not None:
+                years.add(datetime.fromtimestamp(event_time, timezone.utc).year)
+
+    def get_stale_years(self, athlete_id: int) -> List[int]:
+        with self.lock:
+            return sorted(set().union(*self.stale.get(athlete_id, {}).values()))
+
+    def reconcile(
+        self, athlete_id: int, activities: Iterable[dict], start_date: date, end_date: date
+    ) -> dict:
+        """
+        Synchronise the rollups with the activities fetched for a window.
+        Fetched activities are upserted, known activities of the window which were
+        not fetched anymore have been deleted on Strava and are removed.
+
+        Args:
+            athlete_id (int): Owner of the activities
+            activities (Iterable[dict]): All the activities of the window
+            start_date (date): Start of the window
+            end_date (date): End of the window
+
+        Returns:
+            dict: Number of activities upserted and ids of the activities removed
+        """
+        seen = set()
+        for activity in activities:
+            self.upsert(athlete_id, activity)
+            seen.add(activity["id"])
+
+        with self.lock:
+            removed = [
+                activity_id
+                for activity_id, record in self.activities.get(athlete_id, {}).items()
+                if activity_id not in seen
+                and start_date <= record["start_date_local"].date() <= end_date
+            ]
+        for activity_id in removed:
+            self.remove(athlete_id, activity_id)
+
+        with self.lock:
+            # The years fully inside the window are up to date
+            synced_years = {
+                year for year in range(start_date.year, end_date.year + 1)
+                if start_date <= date(year, 1, 1) and date(year, 12, 31) <= end_date
+            }
+            athlete_stale = self.stale.get(athlete_id, {})
+            for activity_id, years in list(athlete_stale.items()):
+                years -= synced_years
+                if not years:
+                    del athlete_stale[activity_id]
+
+        return {"upserted": len(seen), "removed": removed}
+
+    def get(self, athlete_id: int, period: str, prefix: Optional[str] = None) -> dict:
+        """
+        Get the totals of an athlete for a period.
+
+        Args:
+            athlete_id (int): Athlete
+            period (str): One of PERIODS
+            prefix (str, optional): Keep only the keys starting with it, e.g. the year "2024"
+
+        Returns:
+            dict: key -> totals, sorted by key (by day of the week for "weekday")
+        """
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period {period}, expected one of {PERIODS}")
+
+        with self.lock:
+            period_totals = self.totals.get(athlete_id, {}).get(period, {})
+            return {
+                key: dict(totals)
+                for key, totals in sorted(period_totals.items(), key=lambda item: get_sort_key(period, item[0]))
+                if prefix is None or key.startswith(prefix)
+            }
+
+    def _apply(self, athlete_id: int, record: dict, sign: int) -> None:
+        # Keep only runs, as for get_strava_activities_pandas
+        if record["type"] != "Run":
+            return
+
+        athlete_totals = self.totals.setdefault(athlete_id, {})
+        for period, key in get_period_keys(record["start_date_local"]).items():
+            period_totals = athlete_totals.setdefault(period, {})
+            totals = period_totals.setdefault(key, dict.fromkeys(TOTAL_FIELDS, 0))
+            totals["count"] += sign
+            totals["distance"] += sign * record["distance"]
+            totals["moving_time"] += sign * record["moving_time"]
+            totals["total_elevation_gain"] += sign * record["total_elevation_gain"]
+            if totals["count"] == 0:
+                del period_totals[key]
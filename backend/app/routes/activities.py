@@ -0,0 +1,106 @@
+from flask import Blueprint, Response, jsonify, request, session, stream_with_context
+from app.strava_manager import StravaManager
+from app.export import (
+    EXPORT_CONTENT_TYPES,
+    EXPORT_FORMATS,
+    decode_cursor,
+    iter_export_records,
+    stream_csv,
+    stream_ndjson,
+    stream_parquet,
+    to_utc,
+)
+from app.geo import Region
+from app.streams import reduce_stream
+from .stats import activity_locations  # Import the start coordinates of the synced activities
+from datetime import datetime, timezone
+import importlib.util
+
+bp = Blueprint('activities', __name__, url_prefix='/api/activities')
+
+@bp.route('/export')
+def export_activities():
+    if 'athlete' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Invalid format, expected one of {EXPORT_FORMATS}'}), 400
+
+    if export_format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        return jsonify({'error': 'Parquet export requires pyarrow'}), 501
+
+    try:
+        # Naive UTC dates, as the resume date of the cursor
+        start_date = to_utc(datetime.fromisoformat(request.args.get('start', '2009-01-01'))).replace(tzinfo=None)
+        end_date = to_utc(
+            datetime.fromisoformat(request.args['end']) if 'end' in request.args else datetime.now(timezone.utc)
+        ).replace(tzinfo=None)
+        cursor = request.args.get('cursor')
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError:
+        return jsonify({'error': 'Invalid start, end or cursor'}), 400
+
+    # Resume with the cursor column of the last activity received
+    client = StravaManager()
+    records = iter_export_records(
+        client,
+        start_date,
+        end_date,
+        types=request.args.getlist('type'),
+        cursor=cursor,
+    )
+
+    if export_format == 'csv':
+        body = stream_csv(records)
+    elif export_format == 'parquet':
+        body = stream_parquet(records)
+    else:
+        body = stream_ndjson(records)
+
+    return Response(
+        stream_with_context(body),
+        mimetype=EXPORT_CONTENT_TYPES[export_format],
+        headers={'Content-Disposition': f'attachment; filename=activities.{export_format}'}
+    )
+
+@bp.route('/near', methods=['GET', 'POST'])
+def activities_near():
+    if 'athlete' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    # GET with lat, lng and radius_km, or POST with a region (center and radius_m, or polygon)
+    try:
+        if request.method == 'POST':
+            region = Region.from_dict(request.get_json(silent=True) or {})
+        else:
+            region = Region(
+                center=(float(request.args['lat']), float(request.args['lng'])),
+                radius_m=float(request.args.get('radius_km', 5)) * 1000,
+            )
+    except (KeyError, TypeError):
+        return jsonify({'error': 'Invalid region'}), 400
+    except ValueError as e:
+        return jsonify({'error': f'Invalid region: {str(e)}'}), 400
+
+    activity_ids = activity_locations.within_region(session['athlete']['id'], region)
+
+    return jsonify({'activity_ids': activity_ids})
+
+@bp.route('/<int:activity_id>/stream')
+def activity_stream(activity_id):
+    if 'athlete' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    try:
+        target_points = int(request.args.get('points', 500))
+    except ValueError:
+        return jsonify({'error': 'Invalid points'}), 400
+    target_points = min(max(target_points, 2), 5000)
+
+    # Reduce the full resolution stream before sending it to the frontend
+    client = StravaManager()
+    stream = client.get_activity_stream(activity_id=activity_id)
+
+    return jsonify({'activity_id': activity_id, **reduce_stream(stream, target_points)})
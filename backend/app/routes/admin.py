@@ -0,0 +1,45 @@
+from flask import Blueprint, Response, current_app, jsonify, request
+from app.profiler import profiler
+import hmac
+
+bp = Blueprint('admin', __name__, url_prefix='/api/admin')
+
+@bp.before_request
+def check_admin_token():
+    admin_token = current_app.config['ADMIN_TOKEN']
+    if not admin_token or not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token):
+        return jsonify({'error': 'Forbidden'}), 403
+
+@bp.route('/profiler', methods=['GET'])
+def get_profiler():
+    return jsonify(profiler.summary())
+
+@bp.route('/profiler', methods=['POST'])
+def configure_profiler():
+    # Configures the profiler of the worker process handling the request only
+    data = request.get_json(silent=True) or {}
+    for key in ('endpoints', 'blueprints'):
+        value = data.get(key, [])
+        if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+            return jsonify({'error': f'{key} must be a list of strings'}), 400
+
+    try:
+        profiler.configure(
+            enabled=bool(data.get('enabled', False)),
+            sample_rate=float(data.get('sample_rate', 0.1)),
+            endpoints=data.get('endpoints', []),
+            blueprints=data.get('blueprints', []),
+            interval=float(data.get('interval', 0.01)),
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    if data.get('reset'):
+        profiler.reset()
+
+    return jsonify(profiler.summary())
+
+@bp.route('/profiler/report')
+def get_profiler_report():
+    # Folded stacks, e.g. flamegraph.pl report.txt > report.svg or speedscope
+    return Response(profiler.folded(request.args.get('endpoint')), mimetype='text/plain')
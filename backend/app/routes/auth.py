@@ -1,5 +1,6 @@
 from flask import Blueprint, current_app, request, jsonify, session
 from app.strava_manager import StravaManager
+from app.tokens import athlete_tokens
 from .contests import contests  # Import the contests dictionary
 from datetime import datetime
 
@@ -40,18 +41,18 @@ def strava_callback():
         'lastname': athlete.lastname,
         'profile': athlete.profile
     }
+    # Keep the tokens to write on behalf of the athlete later, see app.description_writer
+    athlete_tokens.set(athlete.id, session['access_token'], session['refresh_token'], session['expires_at'])
     
     # If there's a pending contest, update the participant's Strava connection status
     if 'pending_contest_id' in session:
         contest_id = session['pending_contest_id']
         if contest_id in contests:
             contest = contests[contest_id]
-            participant = next(
-                (p for p in contest['participants'] if p['id'] == athlete.id),
-                None
-            )
+            participant = contest.get_participant(athlete.id)
             if participant:
-                participant['strava_connected'] = True
+                participant.strava_connected = True
+                contest.touch()
         session.pop('pending_contest_id')
     
     return jsonify({
@@ -69,11 +70,11 @@ def check_strava_completion():
         data = request.get_json()
         athlete_id = session['athlete']['id']
         
-        # Initialize Strava manager
-        client = StravaManager(session=False)
+        # Initialize Strava manager with the token of the athlete, used on a cache miss or refresh
+        client = StravaManager()
         
-        # Get athlete stats from Strava API
-        athlete_stats = client.strava_client.get_athlete_stats(athlete_id)
+        # Get athlete stats from Strava API (cached)
+        athlete_stats = client.get_athlete_stats(athlete_id)
         
         # Get recent run totals
         recent_runs = athlete_stats.recent_run_totals
@@ -1,12 +1,20 @@
-from flask import Blueprint, jsonify, request, session
+from flask import Blueprint, current_app, jsonify, request, session
 from app.strava_manager import StravaManager
-from datetime import datetime, timedelta
+from app.schedule import SCHEDULE_TYPES, WEEKDAYS, CompiledSchedule, compile_required_mask
+from app.models import Contest, Participant, Schedule
+from app.serialization import json_response
+from app.geo import Region, RegionIndex
+from app.tokens import athlete_tokens
+from .stats import activity_locations, day_index, rollups  # Import the indexes of the athletes
+from datetime import date, datetime, timedelta
 import json
 
 bp = Blueprint('contests', __name__, url_prefix='/api/contests')
 
 # In-memory storage for contests (replace with database in production)
 contests = {}
+# Regions of the local contests, by contest id
+contest_regions = RegionIndex()
 
 @bp.route('/create', methods=['POST'])
 def create_contest():
@@ -18,33 +26,52 @@ def create_contest():
     
     # Validate schedule
     schedule = data.get('schedule', {})
-    if not schedule.get('type') or not schedule.get('distance'):
+    if not isinstance(schedule, dict) or not schedule.get('type') or not schedule.get('distance'):
         return jsonify({'error': 'Invalid schedule format'}), 400
     
-    if schedule['type'] == 'weekly' and (not schedule.get('days') or len(schedule['days']) == 0):
+    if schedule['type'] not in SCHEDULE_TYPES:
+        return jsonify({'error': f'Schedule type must be one of {SCHEDULE_TYPES}'}), 400
+    
+    if schedule['type'] == 'weekly' and (not isinstance(schedule.get('days'), list) or len(schedule['days']) == 0):
         return jsonify({'error': 'Weekly schedule must include at least one day'}), 400
+
+    if schedule['type'] == 'weekly' and any(
+        not isinstance(day, str) or day.lower() not in WEEKDAYS for day in schedule['days']
+    ):
+        return jsonify({'error': 'Weekly schedule days must be week day names'}), 400
     
-    contest = {
-        'id': contest_id,
-        'creator_id': session['athlete']['id'],
-        'title': data['title'],
-        'stake_amount': data['stake_amount'],
-        'start_date': datetime.now().isoformat(),
-        'end_date': (datetime.now() + timedelta(days=30)).isoformat(),
-        'schedule': schedule,
-        'participants': [{
-            'id': session['athlete']['id'],
-            'name': f"{session['athlete']['firstname']} {session['athlete']['lastname']}",
-            'paid': False,
-            'completed_days': 0,
-            'last_verified': None,
-            'strava_connected': False
-        }],
-        'status': 'pending'
-    }
+    # Local contest: runs must start inside the region
+    region = None
+    if data.get('region'):
+        try:
+            region = Region.from_dict(data['region'])
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': f'Invalid region: {str(e)}'}), 400
+    
+    start_date = datetime.now()
+    end_date = start_date + timedelta(days=30)
+    schedule = Schedule.from_dict(schedule)
+    # Bit i is set when the i-th day of the contest is a running day
+    schedule.required_mask = compile_required_mask(
+        schedule, start_date.date(), (end_date.date() - start_date.date()).days
+    )
+
+    contest = Contest(
+        id=contest_id,
+        creator_id=session['athlete']['id'],
+        title=data['title'],
+        stake_amount=data['stake_amount'],
+        start_date=start_date,
+        end_date=end_date,
+        schedule=schedule,
+        participants=[Participant.from_athlete(session['athlete'])],
+        region=region,
+    )
     
     contests[contest_id] = contest
-    return jsonify(contest)
+    if region is not None:
+        contest_regions.upsert(contest_id, region)
+    return json_response(contest)
 
 @bp.route('/join/<int:contest_id>', methods=['POST'])
 def join_contest(contest_id):
@@ -57,20 +84,11 @@ def join_contest(contest_id):
     contest = contests[contest_id]
     
     # Check if user is already in contest
-    if any(p['id'] == session['athlete']['id'] for p in contest['participants']):
+    if contest.has_participant(session['athlete']['id']):
         return jsonify({'error': 'Already joined'}), 400
     
-    participant = {
-        'id': session['athlete']['id'],
-        'name': f"{session['athlete']['firstname']} {session['athlete']['lastname']}",
-        'paid': False,
-        'completed_days': 0,
-        'last_verified': None,
-        'strava_connected': False
-    }
-    
-    contest['participants'].append(participant)
-    return jsonify(contest)
+    contest.add_participant(Participant.from_athlete(session['athlete']))
+    return json_response(contest)
 
 @bp.route('/list')
 def list_contests():
@@ -79,11 +97,36 @@ def list_contests():
     
     athlete_id = session['athlete']['id']
     user_contests = {
-        'participating': [c for c in contests.values() if any(p['id'] == athlete_id for p in c['participants'])],
-        'available': [c for c in contests.values() if not any(p['id'] == athlete_id for p in c['participants'])]
+        'participating': [c for c in contests.values() if c.has_participant(athlete_id)],
+        'available': [c for c in contests.values() if not c.has_participant(athlete_id)]
     }
     
-    return jsonify(user_contests)
+    return json_response(user_contests)
+
+@bp.route('/nearby')
+def nearby_contests():
+    if 'athlete' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    try:
+        lat = float(request.args['lat'])
+        lng = float(request.args['lng'])
+        radius_km = float(request.args.get('radius_km', 10))
+    except (KeyError, ValueError):
+        return jsonify({'error': 'lat and lng are required'}), 400
+    
+    # Local contests whose region is within radius_km, closest first
+    try:
+        near = contest_regions.near(lat, lng, radius_km * 1000)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    nearby = [
+        {'contest': contests[contest_id], 'distance_km': distance / 1000}
+        for contest_id, distance in near
+        if contest_id in contests
+    ]
+    
+    return json_response({'contests': nearby})
 
 @bp.route('/verify-run/<int:contest_id>', methods=['POST'])
 def verify_run(contest_id):
@@ -97,57 +140,124 @@ def verify_run(contest_id):
     athlete_id = session['athlete']['id']
     
     # Find participant in contest
-    participant = next((p for p in contest['participants'] if p['id'] == athlete_id), None)
+    participant = contest.get_participant(athlete_id)
     if not participant:
         return jsonify({'error': 'Not participating in this contest'}), 400
     
     # Check if Strava is connected
-    if not participant.get('strava_connected', False):
+    if not participant.strava_connected:
         return jsonify({'error': 'Please connect your Strava account first'}), 400
     
-    # Check if already verified today
+    # The results are final once the contest is settled
+    if contest.status == 'settled':
+        return jsonify({'error': 'Contest is already settled'}), 400
+    
+    # Day to verify, today by default, a past day can be checked again (disputes)
     today = datetime.now().date()
-    if participant['last_verified'] and datetime.fromisoformat(participant['last_verified']).date() == today:
-        return jsonify({'error': 'Already verified a run today'}), 400
-    
-    # Get today's activities from Strava
-    client = StravaManager()
-    today_start = datetime.combine(today, datetime.min.time())
-    today_end = datetime.combine(today, datetime.max.time())
-    activities = client.get_activities_between(today_start, today_end)
-    
-    # Check if there's any running activity meeting the requirements
-    schedule = contest['schedule']
-    valid_runs = [
-        a for a in activities
-        if a['type'] == 'Run' and
-        a['distance'] >= schedule['distance'] * 1000  # Convert km to meters
-    ]
+    data = request.get_json(silent=True) or {}
+    try:
+        day = date.fromisoformat(data['date']) if data.get('date') else today
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid date'}), 400
+    # The local day of the athlete may be one day ahead of or behind the server day
+    if day > today + timedelta(days=1):
+        return jsonify({'error': 'Cannot verify a future day'}), 400
+    day_label = 'today' if day == today else f"on {day.isoformat()}"
+
+    # Check if already verified
+    compiled_schedule = CompiledSchedule.from_contest(contest)
+    if compiled_schedule.is_completed(participant.completed_mask, day):
+        return jsonify({'error': f'Already verified a run {day_label}'}), 400
+
+    # Check if the day is a running day before querying Strava
+    if compiled_schedule.day_offset(day) is None:
+        return jsonify({'error': f'{day_label.capitalize()} is outside of the contest dates'}), 400
+
+    if not compiled_schedule.is_required(day):
+        day_name = day.strftime('%A').lower()
+        return jsonify({'error': f"{day_label.capitalize()} ({day_name}) is not a scheduled running day"}), 400
     
-    if not valid_runs:
+    # Look up the best run of the local day, Strava is only queried for a day not indexed yet
+    schedule = contest.schedule
+    min_distance = schedule.distance * 1000  # Convert km to meters
+    run = day_index.find_run(athlete_id, day, min_distance, contest.region)
+    if run is None and not day_index.is_covered(athlete_id, day):
+        # start_date_local is the time of the athlete: fetch enough around the day for any timezone
+        client = StravaManager()
+        window_start = datetime.combine(day - timedelta(days=1), datetime.min.time())
+        window_end = datetime.combine(day + timedelta(days=2), datetime.min.time())
+        for activity in client.iter_activities_between(window_start, window_end):
+            day_index.upsert(athlete_id, activity)
+            activity_locations.upsert(athlete_id, activity)
+            rollups.upsert(athlete_id, activity)
+        # The day may still get new runs until it is over in every timezone
+        if day < today - timedelta(days=1):
+            day_index.mark_covered(athlete_id, [day])
+        run = day_index.find_run(athlete_id, day, min_distance, contest.region)
+    
+    if run is None:
         return jsonify({
-            'error': 'No valid running activity found today',
+            'error': f'No valid running activity found {day_label}',
             'requirements': {
-                'distance': f"{schedule['distance']}km",
-                'time': schedule.get('time', 'any')
+                'distance': f"{schedule.distance}km",
+                'time': schedule.time or 'any',
+                'region': contest.region.to_dict() if contest.region else 'any'
             }
         }), 400
     
-    # For weekly schedule, check if today is a running day
-    if schedule['type'] == 'weekly':
-        today_name = today.strftime('%A').lower()
-        if today_name not in schedule['days']:
-            return jsonify({'error': f"Today ({today_name}) is not a scheduled running day"}), 400
-    
     # Update completed days and last verification
-    participant['completed_days'] += 1
-    participant['last_verified'] = datetime.now().isoformat()
+    participant.completed_mask = compiled_schedule.mark_completed(participant.completed_mask, day)
+    participant.completed_days = compiled_schedule.completed_days(participant.completed_mask)
+    participant.last_verified = datetime.now().isoformat()
+    contest.touch()
+
+    # Stamp the progress in the description of the run, written in the background
+    if current_app.config['STAMP_ACTIVITY_DESCRIPTIONS']:
+        athlete_tokens.setdefault(
+            athlete_id, session['access_token'], session['refresh_token'], session['expires_at']
+        )
+        current_app.extensions['description_writer'].enqueue(
+            athlete_id,
+            run['id'],
+            contest_id,
+            f"{contest.title}: {participant.completed_days} days completed "
+            f"({compiled_schedule.completion_pct(participant.completed_mask):.0f}%)",
+        )
     
-    return jsonify({
+    return json_response({
         'contest': contest,
-        'completed_days': participant['completed_days'],
+        'completed_days': participant.completed_days,
+        'streak': compiled_schedule.streak(participant.completed_mask, today),
+        'missed_days': compiled_schedule.missed_days(participant.completed_mask, today),
+        'completion_pct': compiled_schedule.completion_pct(participant.completed_mask),
         'verified_run': {
-            'distance': valid_runs[0]['distance'] / 1000,  # Convert to km
-            'time': valid_runs[0]['start_date_local']
+            'distance': run['distance'] / 1000,  # Convert to km
+            'time': run['start_date_local'].isoformat()
         }
-    }) 
\ No newline at end of file
+    })
+
+@bp.route('/settle/<int:contest_id>', methods=['POST'])
+def settle_contest(contest_id):
+    if 'athlete' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    if contest_id not in contests:
+        return jsonify({'error': 'Contest not found'}), 404
+    
+    contest = contests[contest_id]
+    if contest.creator_id != session['athlete']['id']:
+        return jsonify({'error': 'Only the creator can settle the contest'}), 403
+    
+    if datetime.now() < contest.end_date:
+        return jsonify({'error': 'Contest is not over yet'}), 400
+    
+    # Settle every participant in one step from the completion bitmaps
+    compiled_schedule = CompiledSchedule.from_contest(contest)
+    results = compiled_schedule.settle([p.completed_mask for p in contest.participants])
+    for participant, result in zip(contest.participants, results):
+        for key, value in result.items():
+            setattr(participant, key, value)
+    contest.status = 'settled'
+    contest.touch()
+    
+    return json_response(contest)
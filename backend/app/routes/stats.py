@@ -0,0 +1,107 @@
+from flask import Blueprint, current_app, jsonify, request, session
+from app.strava_manager import StravaManager
+from app.rollups import ActivityRollups, PERIODS
+from app.cache import athlete_profiles, athlete_stats, invalidate_athlete
+from app.geo import ActivityLocationIndex
+from app.day_index import DayIndex
+from datetime import datetime, date, timedelta
+
+bp = Blueprint('stats', __name__, url_prefix='/api/stats')
+
+# In-memory storage for the rollups (replace with database in production)
+rollups = ActivityRollups()
+# Start coordinates of the synced activities
+activity_locations = ActivityLocationIndex()
+# Runs of the athletes by local day, used to verify the contest days
+day_index = DayIndex()
+
+@bp.route('/sync', methods=['POST'])
+def sync_rollups():
+    if 'athlete' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    data = request.get_json(silent=True) or {}
+    try:
+        year = int(data.get('year', datetime.now().year))
+        date(year, 1, 1)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid year'}), 400
+    athlete_id = session['athlete']['id']
+
+    # Fetch the whole year once, the dashboards then read the rollups only
+    client = StravaManager()
+    start_date = datetime(year, 1, 1, 0, 0, 0)
+    end_date = datetime(year, 12, 31, 23, 59, 59)
+    activities = client.iter_activities_between(start_date, end_date)
+    result = rollups.reconcile(
+        athlete_id,
+        index_activities(athlete_id, activities),
+        date(year, 1, 1),
+        date(year, 12, 31),
+    )
+    for activity_id in result['removed']:
+        activity_locations.remove(athlete_id, activity_id)
+        day_index.remove(athlete_id, activity_id)
+    # The fetch window is in UTC: the local first and last days of the year are only
+    # partly fetched, and the recent days may still get new runs in some timezone
+    first_day = date(year, 1, 2)
+    last_day = min(date(year, 12, 30), date.today() - timedelta(days=2))
+    day_index.mark_covered(
+        athlete_id,
+        (first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1))
+    )
+    # New activities may change the athlete stats
+    invalidate_athlete(athlete_id)
+
+    return jsonify({'year': year, 'upserted': result['upserted'], 'removed': len(result['removed'])})
+
+def index_activities(athlete_id, activities):
+    """Add the activities to the location and day indexes while they are consumed"""
+    for activity in activities:
+        activity_locations.upsert(athlete_id, activity)
+        day_index.upsert(athlete_id, activity)
+        yield activity
+
+@bp.route('/rollups')
+def get_rollups():
+    if 'athlete' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    period = request.args.get('period', 'month')
+    if period not in PERIODS:
+        return jsonify({'error': f'Invalid period, expected one of {PERIODS}'}), 400
+
+    athlete_id = session['athlete']['id']
+    year = request.args.get('year')
+    # Years with activities changed since the last sync, POST /sync to update them
+    stale_years = [
+        stale_year for stale_year in rollups.get_stale_years(athlete_id)
+        if year is None or str(stale_year) == year
+    ]
+
+    return jsonify({
+        'period': period,
+        'rollups': rollups.get(athlete_id, period, prefix=year),
+        'stale': bool(stale_years),
+        'stale_years': stale_years
+    })
+
+@bp.route('/cache')
+def get_cache_stats():
+    if 'athlete' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    return jsonify({
+        'caches': [athlete_profiles.stats(), athlete_stats.stats()]
+    })
+
+@bp.route('/description-writes')
+def get_description_write_metrics():
+    if 'athlete' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    description_writer = current_app.extensions.get('description_writer')
+    if description_writer is None:
+        return jsonify({'enabled': False})
+
+    return jsonify({'enabled': True, **description_writer.get_metrics()})
@@ -0,0 +1,51 @@
+from flask import Blueprint, current_app, jsonify, request
+from app.cache import athlete_profiles, athlete_stats
+from app.tokens import athlete_tokens
+from .stats import activity_locations, day_index, rollups  # Import the indexes of the athletes
+
+bp = Blueprint('webhooks', __name__, url_prefix='/api/webhooks')
+
+@bp.route('/strava', methods=['GET'])
+def validate_strava_subscription():
+    # Strava checks the callback URL when the subscription is created
+    verify_token = current_app.config['STRAVA_WEBHOOK_VERIFY_TOKEN']
+    if not verify_token or request.args.get('hub.verify_token') != verify_token:
+        return jsonify({'error': 'Invalid verify token'}), 403
+
+    return jsonify({'hub.challenge': request.args.get('hub.challenge')})
+
+@bp.route('/strava', methods=['POST'])
+def strava_event():
+    event = request.get_json(silent=True) or {}
+    subscription_id = current_app.config['STRAVA_WEBHOOK_SUBSCRIPTION_ID']
+    if not subscription_id or str(event.get('subscription_id')) != subscription_id:
+        return jsonify({'error': 'Invalid subscription'}), 403
+
+    athlete_id = event.get('owner_id')
+    if athlete_id is None:
+        return jsonify({'error': 'Invalid event'}), 400
+
+    if event.get('object_type') == 'activity':
+        # Any activity change may change the athlete stats
+        athlete_stats.invalidate(athlete_id)
+        if event.get('aspect_type') == 'delete':
+            rollups.remove(athlete_id, event.get('object_id'))
+            activity_locations.remove(athlete_id, event.get('object_id'))
+            day_index.remove(athlete_id, event.get('object_id'))
+        else:
+            # The edited activity may not qualify anymore, and the new or edited
+            # activity may be a run of a day already fetched: fetch the days again
+            day_index.remove(athlete_id, event.get('object_id'))
+            day_index.clear_covered(athlete_id)
+            # The event has no activity details, the rollups are updated by the next sync
+            rollups.mark_stale(athlete_id, event.get('object_id'), event.get('event_time'))
+
+    elif event.get('object_type') == 'athlete':
+        athlete_profiles.invalidate(athlete_id)
+        athlete_stats.invalidate(athlete_id)
+        # The athlete revoked the access of the application
+        if str((event.get('updates') or {}).get('authorized')).lower() == 'false':
+            athlete_tokens.remove(athlete_id)
+
+    # Strava expects an answer within 2 seconds
+    return jsonify({'success': True})
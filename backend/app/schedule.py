@@ -0,0 +1,153 @@
+from datetime import date
+from typing import List, Optional
+
+SCHEDULE_TYPES = ["daily", "weekly"]
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+
+def popcount(mask: int) -> int:
+    """
+        Return the number of bits set in a mask
+    """
+    return bin(mask).count("1")
+
+
+def compile_required_mask(schedule, start_date: date, duration_days: int) -> int:
+    """
+        Compile a contest schedule into the bitmap of its required days
+    :param schedule: Schedule of the contest, type "daily" or "weekly" with its days
+    :param start_date: first day of the contest, bit 0 of the mask
+    :param duration_days: number of days of the contest
+    :return: mask: bit i is set when the day start_date + i is a running day
+    """
+    if schedule.type == "weekly":
+        weekdays = {WEEKDAYS.index(day.lower()) for day in schedule.days}
+    elif schedule.type == "daily":
+        weekdays = set(range(7))
+    else:
+        raise ValueError(f"Unknown schedule type {schedule.type}, expected one of {SCHEDULE_TYPES}")
+
+    mask = 0
+    first_weekday = start_date.weekday()
+    for i in range(duration_days):
+        if (first_weekday + i) % 7 in weekdays:
+            mask |= 1 << i
+    return mask
+
+
+class CompiledSchedule:
+    """
+    Class to answer the schedule questions of a contest with bit operations
+        - Required days bitmap of the contest
+        - Completion bitmap of each participant
+        - Streak, missed days, completion percentage and settlement
+    """
+
+    def __init__(self, start_date: date, duration_days: int, required_mask: int):
+        self.start_date = start_date
+        self.duration_days = duration_days
+        self.required_mask = required_mask
+
+    @classmethod
+    def from_contest(cls, contest) -> "CompiledSchedule":
+        start_date = contest.start_date.date()
+        end_date = contest.end_date.date()
+        return cls(start_date, (end_date - start_date).days, contest.schedule.required_mask)
+
+    def day_offset(self, day: date) -> Optional[int]:
+        """
+            Return the bit of a day, None if the day is outside the contest
+        """
+        i = (day - self.start_date).days
+        if 0 <= i < self.duration_days:
+            return i
+        return None
+
+    def is_required(self, day: date) -> bool:
+        i = self.day_offset(day)
+        return i is not None and bool(self.required_mask >> i & 1)
+
+    def is_completed(self, completed_mask: int, day: date) -> bool:
+        i = self.day_offset(day)
+        return i is not None and bool(completed_mask >> i & 1)
+
+    def mark_completed(self, completed_mask: int, day: date) -> int:
+        """
+            Return the completion mask with the day set
+        """
+        i = self.day_offset(day)
+        if i is None:
+            raise ValueError(f"{day} is outside of the contest")
+        return completed_mask | 1 << i
+
+    def completed_days(self, completed_mask: int) -> int:
+        return popcount(self.required_mask & completed_mask)
+
+    def missed_days(self, completed_mask: int, as_of: date) -> int:
+        """
+            Return the number of required days before as_of without a run
+        """
+        i = min(max((as_of - self.start_date).days, 0), self.duration_days)
+        return popcount(self.required_mask & ~completed_mask & ((1 << i) - 1))
+
+    def streak(self, completed_mask: int, as_of: date) -> int:
+        """
+            Return the number of consecutive required days completed up to as_of.
+            A required as_of day without a run yet does not break the streak.
+        """
+        i = min(max((as_of - self.start_date).days + 1, 0), self.duration_days)
+        required = self.required_mask & ((1 << i) - 1)
+        missed = required & ~completed_mask
+        if missed and missed.bit_length() == i and i > 0:
+            # as_of itself is still in progress
+            required &= (1 << (i - 1)) - 1
+            missed = required & ~completed_mask
+        if not missed:
+            return popcount(required)
+        return popcount(required >> missed.bit_length())
+
+    def completion_pct(self, completed_mask: int) -> float:
+        required_days = popcount(self.required_mask)
+        if not required_days:
+            return 100.0
+        return 100.0 * self.completed_days(completed_mask) / required_days
+
+    def settle(self, completed_masks: List[int]) -> List[dict]:
+        """
+        Settle all the participants of a contest at once.
+        The completion masks are packed in a matrix and counted in one numpy step.
+
+        Args:
+            completed_masks (List[int]): Completion mask of each participant
+
+        Returns:
+            List[dict]: Completed days, missed days, completion percentage and
+            whether the participant met every required day, in the same order
+        """
+        import numpy as np
+
+        n_bytes = max((self.duration_days + 7) // 8, 1)
+        required = np.frombuffer(self.required_mask.to_bytes(n_bytes, "little"), dtype=np.uint8)
+        completed = np.frombuffer(
+            b"".join(mask.to_bytes(n_bytes, "little") for mask in completed_masks),
+            dtype=np.uint8,
+        ).reshape(len(completed_masks), n_bytes)
+
+        required_days = int(np.unpackbits(required).sum())
+        completed_days = np.unpackbits(completed & required, axis=1).sum(axis=1)
+        missed_days = required_days - completed_days
+        completion_pct = (
+            100.0 * completed_days / required_days if required_days
+            else np.full(len(completed_masks), 100.0)
+        )
+
+        return [
+            {
+                "completed_days": int(completed_days[i]),
+                "missed_days": int(missed_days[i]),
+                "completion_pct": float(completion_pct[i]),
+                "passed": bool(missed_days[i] == 0),
+            }
+            for i in range(len(completed_masks))
+        ]
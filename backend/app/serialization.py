@@ -0,0 +1,29 @@
+import json
+
+from flask import Response
+
+from app.models import Contest
+
+
+def encode_json(value) -> bytes:
+    """
+        Encode a value to JSON, reusing the cached encoding of the contests
+    :param value: dict, list, Contest or any JSON serializable value
+    :return: JSON bytes
+    """
+    if isinstance(value, Contest):
+        return value.to_json()
+    if isinstance(value, dict):
+        return b"{" + b",".join(
+            json.dumps(str(key)).encode() + b":" + encode_json(item) for key, item in value.items()
+        ) + b"}"
+    if isinstance(value, (list, tuple)):
+        return b"[" + b",".join(encode_json(item) for item in value) + b"]"
+    return json.dumps(value, default=str).encode()
+
+
+def json_response(value, status: int = 200) -> Response:
+    """
+        Same as flask.jsonify, with the cached encoding of the contests
+    """
+    return Response(encode_json(value), status=status, mimetype="application/json")
@@ -1,14 +1,20 @@
-import pandas as pd
-import stravalib.exc
+from __future__ import annotations
+
 from flask import current_app
 from datetime import datetime, timedelta, date
 import logging
-from typing import List
+import threading
+import time
+from typing import List, Tuple, TYPE_CHECKING
 from flask import session
 
-import requests
-from stravalib.client import Client
-from stravalib.client import BatchedResultsIterator
+from app.cache import athlete_profiles, athlete_stats
+
+# pandas, stravalib and requests are heavy to import: they are imported where they
+# are used so that the workers boot without them (see startup_profile.py)
+if TYPE_CHECKING:
+    import pandas as pd
+    from stravalib.client import BatchedResultsIterator
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -43,6 +49,8 @@ class StravaManager:
 
     def __init__(self, session=True):
         """Init Strava Client"""
+        from stravalib.client import Client
+
         self.strava_client_id = int(current_app.config['STRAVA_CLIENT_ID'])
         self.strava_client_secret = current_app.config['STRAVA_CLIENT_SECRET']
         self.strava_activity_column = get_strava_activity_column()
@@ -103,6 +111,8 @@ class StravaManager:
         Raises:
             stravalib.exc.Fault: If the token exchange fails
         """
+        import stravalib.exc
+
         try:
             token_response = self.strava_client.exchange_code_for_token(
                 client_id=self.strava_client_id,
@@ -143,6 +153,8 @@ class StravaManager:
         class:`stravalib.model.Athlete`
             The athlete model object.
         """
+        import requests
+
         url = "https://www.strava.com/api/v3/athlete"
 
         headers = {"Authorization": f"Bearer {self.strava_client.access_token}"}
@@ -157,41 +169,64 @@ class StravaManager:
 
         return athlete
 
-    def get_athlete(self):
+    def get_athlete(self, athlete_id: int = None):
         """
             Get Athlete from  STRAVA API:
             https://developers.strava.com/docs/reference/#api-Athletes
+            The profile is cached per athlete, see app.cache. Strava only returns
+            the owner of the token: athlete_id, when given, must be this athlete.
+            Without athlete_id (e.g. just after the token exchange) the profile is
+            fetched and cached.
 
         Returns
         -------
         class:`stravalib.model.Athlete`
             The athlete model object.
+
+        Raises
+        ------
+        ValueError
+            If athlete_id is not the owner of the token
         """
-        athlete = self.strava_client.get_athlete()
-        return athlete
+        if athlete_id is None:
+            athlete = self.strava_client.get_athlete()
+            athlete_profiles.set(athlete.id, athlete)
+            return athlete
+
+        def load_athlete():
+            athlete = self.strava_client.get_athlete()
+            if athlete.id != athlete_id:
+                raise ValueError(f"The token belongs to athlete {athlete.id}, not to athlete {athlete_id}")
+            return athlete
+
+        return athlete_profiles.get_or_load(athlete_id, load_athlete)
+
+    def get_athlete_stats(self, athlete_id: int):
+        """
+            Get Athlete Stats from  STRAVA API:
+            https://developers.strava.com/docs/reference/#api-Athletes-getStats
+            The stats are cached per athlete, an expired value is returned while
+            it is refreshed in the background, see app.cache.
+
+        Returns
+        -------
+        class:`stravalib.model.AthleteStats`
+            The athlete stats model object.
+        """
+        client = self.strava_client
+        return athlete_stats.get_or_load(athlete_id, lambda: client.get_athlete_stats(athlete_id))
 
     def update_description_activity(self, activity_id: int, description: str):
         """
         Update the Description of an activity using the STRAVA API:
         https://developers.strava.com/docs/reference/#api-activity
-        """
-        url = f"https://www.strava.com/api/v3/activities/{activity_id}"
-        headers = {
-            "Authorization": f"Bearer {self.strava_client.access_token}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "description": description
-        }
-
-        response = requests.put(url, headers=headers, json=data)
+        To update many activities, see app.description_writer.
 
-        if response.status_code == 200:
-            activity = response.json()
-        else:
-            raise Exception(f"Error: {response.status_code} - {response.text}")
+        Raises:
+            StravaRequestError: If Strava does not answer with a 200
+        """
+        return put_activity_description(self.strava_client.access_token, activity_id, description)
 
-        return activity
     def get_activity(self, activity_id: int):
         """
             Get Activity from  STRAVA API:
@@ -202,6 +237,7 @@ class StravaManager:
         class:`stravalib.model.Activity`
             The Activity model object.
         """
+        import requests
 
         url = f"https://www.strava.com/api/v3/activities/{activity_id}?include_all_efforts="
 
@@ -224,12 +260,13 @@ class StravaManager:
 
         Returns
         -------
-        Dict stream From Strava API V3 with the time, heart-rate latitude and longitude.
+        Dict stream From Strava API V3 with the time, distance, heart-rate latitude and longitude.
         """
+        import requests
 
         url = (
             f"https://www.strava.com/api/v3/activities/{activity_id}/"
-            f"streams?keys=time,heartrate,latlng&key_by_type=true"
+            f"streams?keys=time,distance,heartrate,latlng&key_by_type=true"
         )
 
         headers = {"Authorization": f"Bearer {self.strava_client.access_token}"}
@@ -306,6 +343,28 @@ class StravaManager:
 
         return activities_df
 
+    def iter_activities_between(self, start_date: date, end_date: date):
+        """
+        Iterate over the activities between two dates without building a DataFrame.
+        Strava pages are fetched lazily while the generator is consumed.
+
+        Args:
+            start_date (date): Start of the window
+            end_date (date): End of the window
+
+        Yields:
+            dict: One activity record per activity, see get_strava_activity_record
+        """
+        start_date_str = start_date.strftime("%Y-%m-%dT%H:%M:%SZ")
+        end_date_str = end_date.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+        activities = self.strava_client.get_activities(
+            after=start_date_str, before=end_date_str, limit=None
+        )
+
+        for activity in activities:
+            yield get_strava_activity_record(activity)
+
     def check_challenge_completion(self, start_date: date, end_date: date, target_distance: float) -> bool:
         """
         Check if the user has completed their running challenge based on Strava activities.
@@ -333,12 +392,172 @@ class StravaManager:
             return False
 
 
+class StravaRequestError(Exception):
+    """
+    Error answered by the STRAVA API, with the HTTP status code (None if the
+    request did not reach Strava)
+    """
+
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# Strava counts the requests of an application in 15 minutes windows starting at
+# 0, 15, 30 and 45 minutes, and in days starting at midnight UTC
+RATE_WINDOW_SECONDS = 15 * 60
+RATE_DAY_SECONDS = 24 * 3600
+
+
+class StravaRateLimit:
+    """
+    Usage of the Strava rate limits by the application, read from the
+    X-RateLimit-Limit and X-RateLimit-Usage headers ("15min,daily") of the answers
+    """
+
+    def __init__(self, limits: Tuple[int, int] = (200, 2000)):
+        self.limits = limits
+        self.usage = (0, 0)
+        self.updated_at = None
+        self.lock = threading.Lock()
+
+    def update(self, headers, now: float = None) -> None:
+        usage = headers.get("X-RateLimit-Usage")
+        if not usage:
+            return
+        try:
+            usage = tuple(int(value) for value in usage.split(","))[:2]
+            limits = headers.get("X-RateLimit-Limit")
+            limits = tuple(int(value) for value in limits.split(","))[:2] if limits else self.limits
+        except ValueError:
+            return
+        with self.lock:
+            self.usage = usage
+            self.limits = limits
+            self.updated_at = time.time() if now is None else now
+
+    def delay(self, now: float, requests: int = 1) -> float:
+        """
+            Return the number of seconds before the application can send requests
+            without exceeding the 15 minutes or the daily limit, 0 if it can now
+        """
+        with self.lock:
+            if self.updated_at is None or now // RATE_DAY_SECONDS != self.updated_at // RATE_DAY_SECONDS:
+                return 0.0
+            if self.usage[1] + requests > self.limits[1]:
+                return (now // RATE_DAY_SECONDS + 1) * RATE_DAY_SECONDS - now
+            if (
+                now // RATE_WINDOW_SECONDS == self.updated_at // RATE_WINDOW_SECONDS
+                and self.usage[0] + requests > self.limits[0]
+            ):
+                return (now // RATE_WINDOW_SECONDS + 1) * RATE_WINDOW_SECONDS - now
+            return 0.0
+
+
+strava_rate_limit = StravaRateLimit()
+
+
+def refresh_access_token(client_id: str, client_secret: str, refresh_token: str) -> dict:
+    """
+        Get a new access token with a refresh token using the STRAVA API:
+        https://developers.strava.com/docs/authentication/#refreshingexpiredaccesstokens
+    :param client_id: id of the application
+    :param client_secret: secret of the application
+    :param refresh_token: refresh token of the athlete
+    :return: token: dictionary with access_token, refresh_token and expires_at
+    :raise StravaRequestError: if Strava does not answer with a 200
+    """
+    import requests
+
+    url = "https://www.strava.com/oauth/token"
+    data = {
+        "client_id": client_id,
+        "client_secret": client_secret,
+        "grant_type": "refresh_token",
+        "refresh_token": refresh_token,
+    }
+
+    try:
+        response = requests.post(url, data=data, timeout=30)
+    except requests.RequestException as e:
+        raise StravaRequestError(f"Error: {str(e)}") from e
+
+    strava_rate_limit.update(response.headers)
+    if response.status_code != 200:
+        raise StravaRequestError(f"Error: {response.status_code} - {response.text}", response.status_code)
+
+    return response.json()
+
+
+def put_activity_description(access_token: str, activity_id: int, description: str) -> dict:
+    """
+        Update the Description of an activity using the STRAVA API:
+        https://developers.strava.com/docs/reference/#api-activity
+    :param access_token: access token of the owner of the activity
+    :param activity_id: activity to update
+    :param description: new description
+    :return: activity: the updated activity
+    :raise StravaRequestError: if Strava does not answer with a 200
+    """
+    import requests
+
+    url = f"https://www.strava.com/api/v3/activities/{activity_id}"
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json"
+    }
+    data = {
+        "description": description
+    }
+
+    try:
+        response = requests.put(url, headers=headers, json=data, timeout=30)
+    except requests.RequestException as e:
+        raise StravaRequestError(f"Error: {str(e)}") from e
+
+    strava_rate_limit.update(response.headers)
+    if response.status_code == 200:
+        activity = response.json()
+    else:
+        raise StravaRequestError(f"Error: {response.status_code} - {response.text}", response.status_code)
+
+    return activity
+
+
+def get_activity_description(access_token: str, activity_id: int) -> str:
+    """
+        Get the Description of an activity using the STRAVA API:
+        https://developers.strava.com/docs/reference/#api-activity
+    :param access_token: access token of the owner of the activity
+    :param activity_id: activity to read
+    :return: description: current description, empty if there is none
+    :raise StravaRequestError: if Strava does not answer with a 200
+    """
+    import requests
+
+    url = f"https://www.strava.com/api/v3/activities/{activity_id}"
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    try:
+        response = requests.get(url, headers=headers, timeout=30)
+    except requests.RequestException as e:
+        raise StravaRequestError(f"Error: {str(e)}") from e
+
+    strava_rate_limit.update(response.headers)
+    if response.status_code != 200:
+        raise StravaRequestError(f"Error: {response.status_code} - {response.text}", response.status_code)
+
+    return response.json().get("description") or ""
+
+
 def get_strava_activities_string(activities: BatchedResultsIterator) -> List:
     """
         Return from a Batch from Strava API into a list of activity dictionary
     :param BatchedResultsIterator activities: Batch
     :return: data
     """
+    import stravalib.exc
+
     data = []
     try:
         logging.info(
@@ -357,6 +576,20 @@ def get_strava_activities_string(activities: BatchedResultsIterator) -> List:
     return data
 
 
+def get_strava_activity_record(activity) -> dict:
+    """
+        Convert one activity from the Strava API into a plain dictionary
+    :param activity: stravalib activity model
+    :return: record: dictionary with the id, the start_date and the columns of get_strava_activity_column
+    """
+    my_dict = activity.dict()
+    record = {"id": activity.id}
+    record.update({x: my_dict.get(x) for x in get_strava_activity_column()})
+    # UTC start date, the Strava API filters on it with the after/before parameters
+    record["start_date"] = my_dict.get("start_date")
+    return record
+
+
 def seconds_to_hms(seconds: int) -> str:
     """
         Convert a time in second into HH:MM:SS format
@@ -392,6 +625,8 @@ def get_strava_activities_pandas(activities: List) -> pd.DataFrame:
     :param activities:
     :return:
     """
+    import pandas as pd
+
     my_cols = get_strava_activity_column()
     # Add id to the beginning of the columns, used when selecting a specific activity
     my_cols.insert(0, "id")
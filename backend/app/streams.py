@@ -0,0 +1,189 @@
+import base64
+import heapq
+import math
+import sys
+from array import array
+from typing import List, Optional, Sequence
+
+# Number of points of the window used to compute the pace, as in ExtendedActivity
+PACE_RANGE_POINTS = 20
+# Largest scaled value encoded by encode_deltas, so the delta of two values fits an int32
+MAX_ENCODED_VALUE = 2 ** 30 - 1
+
+
+def simplify_route(latlng: Sequence[Sequence[float]], target_points: int) -> List[int]:
+    """
+        Shape preserving simplification of a route (Douglas-Peucker).
+        The point furthest from its simplified segment is added first, until
+        target_points are kept, so the number of points is chosen by the caller.
+    :param latlng: list of [lat, lng]
+    :param target_points: maximum number of points to keep
+    :return: indices of the points kept, sorted
+    """
+    n = len(latlng)
+    if n <= max(target_points, 2):
+        return list(range(n))
+
+    # Equirectangular projection, accurate enough at the scale of an activity
+    cos_lat = math.cos(math.radians(latlng[0][0]))
+    xs = [p[1] * cos_lat for p in latlng]
+    ys = [p[0] for p in latlng]
+
+    def furthest(start: int, end: int):
+        dx, dy = xs[end] - xs[start], ys[end] - ys[start]
+        norm = math.hypot(dx, dy)
+        best_index, best_distance = None, 0.0
+        for i in range(start + 1, end):
+            if norm:
+                distance = abs(dy * (xs[i] - xs[start]) - dx * (ys[i] - ys[start])) / norm
+            else:
+                distance = math.hypot(xs[i] - xs[start], ys[i] - ys[start])
+            if distance > best_distance:
+                best_index, best_distance = i, distance
+        return best_index, best_distance
+
+    kept = {0, n - 1}
+    heap = []
+    index, distance = furthest(0, n - 1)
+    if index is not None:
+        heap.append((-distance, 0, n - 1, index))
+
+    while heap and len(kept) < target_points:
+        _, start, end, index = heapq.heappop(heap)
+        kept.add(index)
+        for segment_start, segment_end in ((start, index), (index, end)):
+            if segment_end - segment_start > 1:
+                split, distance = furthest(segment_start, segment_end)
+                if split is not None:
+                    heapq.heappush(heap, (-distance, segment_start, segment_end, split))
+
+    return sorted(kept)
+
+
+def minmax_buckets(values: Sequence[Optional[float]], target_points: int) -> List[int]:
+    """
+        Downsample a series keeping the minimum and the maximum of each bucket,
+        so the peaks of the heart-rate or of the pace are not smoothed away.
+    :param values: series to downsample, None values are ignored
+    :param target_points: maximum number of points to keep, at least 2
+    :return: indices of the points kept, sorted
+    """
+    n = len(values)
+    if n <= max(target_points, 2):
+        return list(range(n))
+
+    # The first and the last points are kept, the buckets share the rest of the budget
+    n_buckets = (target_points - 2) // 2
+    kept = {0, n - 1}
+    for bucket in range(n_buckets):
+        start = 1 + bucket * (n - 2) // n_buckets
+        end = 1 + (bucket + 1) * (n - 2) // n_buckets
+        indices = [i for i in range(start, end) if values[i] is not None]
+        if indices:
+            kept.add(min(indices, key=values.__getitem__))
+            kept.add(max(indices, key=values.__getitem__))
+
+    return sorted(kept)
+
+
+def calculate_pace(times: Sequence[float], distances: Sequence[float], range_points: int = PACE_RANGE_POINTS) -> List[Optional[float]]:
+    """
+        Pace in minutes per km over a window of range_points, None when not moving
+    """
+    paces = []
+    for i in range(len(times)):
+        start = max(i - range_points, 0)
+        distance_km = (distances[i] - distances[start]) / 1000
+        if distance_km > 0:
+            paces.append((times[i] - times[start]) / 60 / distance_km)
+        else:
+            paces.append(None)
+    return paces
+
+
+def encode_polyline(latlng: Sequence[Sequence[float]], precision: int = 5) -> str:
+    """
+        Encode a route with the Google encoded polyline algorithm
+    """
+    factor = 10 ** precision
+    encoded = []
+    previous_lat, previous_lng = 0, 0
+    for lat, lng in latlng:
+        lat, lng = round(lat * factor), round(lng * factor)
+        for delta in (lat - previous_lat, lng - previous_lng):
+            delta = ~(delta << 1) if delta < 0 else delta << 1
+            while delta >= 0x20:
+                encoded.append(chr((0x20 | (delta & 0x1F)) + 63))
+                delta >>= 5
+            encoded.append(chr(delta + 63))
+        previous_lat, previous_lng = lat, lng
+    return "".join(encoded)
+
+
+def encode_deltas(values: Sequence[Optional[float]], scale: int = 1) -> dict:
+    """
+        Encode a series as a base64 little-endian Int32Array of the deltas between
+        consecutive values multiplied by scale. None values, and the values which are
+        not finite or out of the MAX_ENCODED_VALUE range once scaled, are encoded as
+        the previous one.
+    """
+    deltas = array("i")
+    previous = 0
+    for value in values:
+        current = previous
+        if value is not None and math.isfinite(value) and abs(value * scale) <= MAX_ENCODED_VALUE:
+            current = round(value * scale)
+        deltas.append(current - previous)
+        previous = current
+    if sys.byteorder == "big":
+        deltas.byteswap()
+    return {
+        "encoding": "delta-int32-base64",
+        "scale": scale,
+        "data": base64.b64encode(deltas.tobytes()).decode(),
+    }
+
+
+def reduce_stream(stream: dict, target_points: int) -> dict:
+    """
+    Reduce an activity stream for the visualisation.
+
+    Args:
+        stream (dict): Stream from StravaManager.get_activity_stream (key_by_type)
+        target_points (int): Number of points of each series
+
+    Returns:
+        dict: Route as an encoded polyline, heart-rate and pace with their time,
+        as delta encoded arrays. A series missing from the stream is None.
+    """
+    times = stream.get("time", {}).get("data", [])
+    reduced = {"original_points": len(times), "route": None, "heartrate": None, "pace": None}
+
+    latlng = stream.get("latlng", {}).get("data")
+    if latlng:
+        kept = simplify_route(latlng, target_points)
+        reduced["route"] = {
+            "points": len(kept),
+            "polyline": encode_polyline([latlng[i] for i in kept]),
+        }
+
+    heartrate = stream.get("heartrate", {}).get("data")
+    if heartrate:
+        kept = minmax_buckets(heartrate, target_points)
+        reduced["heartrate"] = {
+            "points": len(kept),
+            "time": encode_deltas([times[i] for i in kept]),
+            "bpm": encode_deltas([heartrate[i] for i in kept]),
+        }
+
+    distances = stream.get("distance", {}).get("data")
+    if distances and times:
+        paces = calculate_pace(times, distances)
+        kept = minmax_buckets(paces, target_points)
+        reduced["pace"] = {
+            "points": len(kept),
+            "time": encode_deltas([times[i] for i in kept]),
+            "minute_per_km": encode_deltas([paces[i] for i in kept], scale=100),
+        }
+
+    return reduced
@@ -0,0 +1,83 @@
+import threading
+import time
+from typing import Callable, Optional
+
+from app.strava_manager import StravaRequestError, refresh_access_token
+
+# Refresh an access token expiring within this margin
+REFRESH_MARGIN_SECONDS = 300
+
+
+class TokenStore:
+    """
+    Strava tokens of the athletes, used to write on their behalf after their request
+        - In memory (replace with database in production), never written to disk
+        - The access token is refreshed with the refresh token when it is about to expire
+    """
+
+    def __init__(self, refresh: Callable = refresh_access_token):
+        self.refresh = refresh
+        self.client_id = None
+        self.client_secret = None
+        # athlete_id -> {"access_token", "refresh_token", "expires_at"}
+        self.tokens = {}
+        self.lock = threading.Lock()
+        # Only one refresh at a time, Strava may rotate the refresh token
+        self.refresh_lock = threading.Lock()
+
+    def init_app(self, app) -> None:
+        self.client_id = app.config['STRAVA_CLIENT_ID']
+        self.client_secret = app.config['STRAVA_CLIENT_SECRET']
+
+    def set(self, athlete_id: int, access_token: str, refresh_token: str, expires_at) -> None:
+        with self.lock:
+            self.tokens[athlete_id] = {
+                "access_token": access_token,
+                "refresh_token": refresh_token,
+                "expires_at": float(expires_at),
+            }
+
+    def setdefault(self, athlete_id: int, access_token: str, refresh_token: str, expires_at) -> None:
+        """
+            Store the tokens of an athlete unless some are stored already, they may
+            have been refreshed since the session was created
+        """
+        with self.lock:
+            if athlete_id in self.tokens:
+                return
+        self.set(athlete_id, access_token, refresh_token, expires_at)
+
+    def remove(self, athlete_id: int) -> None:
+        with self.lock:
+            self.tokens.pop(athlete_id, None)
+
+    def get_access_token(self, athlete_id: int, now: Optional[float] = None) -> str:
+        """
+        Get a valid access token of an athlete, refreshed if needed.
+
+        Args:
+            athlete_id (int): Athlete
+            now (float, optional): Current epoch, for the tests
+
+        Returns:
+            str: Access token
+
+        Raises:
+            StravaRequestError: If no token is stored (status None, may be retried
+                after the athlete logs in again) or if the refresh fails
+        """
+        now = time.time() if now is None else now
+        with self.refresh_lock:
+            with self.lock:
+                token = self.tokens.get(athlete_id)
+            if token is None:
+                raise StravaRequestError(f"No token stored for athlete {athlete_id}")
+            if token["expires_at"] > now + REFRESH_MARGIN_SECONDS:
+                return token["access_token"]
+
+            response = self.refresh(self.client_id, self.client_secret, token["refresh_token"])
+            self.set(athlete_id, response["access_token"], response["refresh_token"], response["expires_at"])
+            return response["access_token"]
+
+
+athlete_tokens = TokenStore()
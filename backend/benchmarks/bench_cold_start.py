@@ -0,0 +1,84 @@
+"""
+Benchmark the cold start of backend/run.py.
+
+Each run imports run.py in a fresh interpreter, as a new worker does, and the
+median wall time is compared with the target. The heavy dependencies must not be
+imported at boot.
+
+Usage:
+    python benchmarks/bench_cold_start.py [--runs 10] [--target-ms 500]
+
+Exit code is 1 when the target is missed or a heavy dependency is imported at boot.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dependencies which must only be imported by the code paths using them
+LAZY_MODULES = ["pandas", "stravalib", "requests", "pyarrow"]
+
+BOOT_SCRIPT = (
+    "import sys, run; "
+    f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+)
+
+
+def measure_cold_start() -> tuple:
+    """
+        Import run.py in a new interpreter
+    :return: wall time in seconds, list of the lazy modules imported at boot
+    """
+    start_time = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", BOOT_SCRIPT],
+        cwd=BACKEND_DIR,
+        # Never resume nor send the pending description writes from a benchmark process
+        env={**os.environ, "STAMP_ACTIVITY_DESCRIPTIONS": "0"},
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    wall_time = time.perf_counter() - start_time
+    return wall_time, [m for m in output.strip().split(",") if m]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--target-ms", type=float, default=500.0)
+    args = parser.parse_args()
+
+    # First run warms the filesystem cache and the bytecode cache
+    measure_cold_start()
+
+    wall_times = []
+    eager_modules = set()
+    for _ in range(args.runs):
+        wall_time, imported = measure_cold_start()
+        wall_times.append(wall_time * 1e3)
+        eager_modules.update(imported)
+
+    median = statistics.median(wall_times)
+    print(
+        f"cold start: median {median:.1f} ms, min {min(wall_times):.1f} ms, "
+        f"max {max(wall_times):.1f} ms over {args.runs} runs (target {args.target_ms:.0f} ms)"
+    )
+
+    failed = False
+    if eager_modules:
+        print(f"FAIL: imported at boot: {', '.join(sorted(eager_modules))}")
+        failed = True
+    if median > args.target_ms:
+        print("FAIL: cold start above target")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark the memory and the JSON encoding of the contests: plain dicts, as stored
+before app.models, against the slotted models with their cached encoding.
+
+Usage:
+    python benchmarks/bench_models_memory.py [--contests 10000] [--participants 50]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models import Contest, Participant, Schedule  # noqa: E402
+from app.serialization import encode_json  # noqa: E402
+
+START_DATE = datetime(2024, 1, 1)
+END_DATE = START_DATE + timedelta(days=30)
+
+
+def build_dict_contests(n_contests: int, n_participants: int) -> list:
+    return [
+        {
+            "id": i,
+            "creator_id": i,
+            "title": f"Contest {i}",
+            "stake_amount": 10,
+            "start_date": START_DATE.isoformat(),
+            "end_date": END_DATE.isoformat(),
+            "schedule": {"type": "daily", "days": [], "distance": 5, "required_mask": (1 << 30) - 1},
+            "participants": [
+                {
+                    "id": i * n_participants + j,
+                    "name": f"Athlete {j}",
+                    "paid": False,
+                    "completed_days": 0,
+                    "completed_mask": 0,
+                    "last_verified": None,
+                    "strava_connected": False,
+                    "missed_days": None,
+                    "completion_pct": None,
+                    "passed": None,
+                }
+                for j in range(n_participants)
+            ],
+            "status": "pending",
+        }
+        for i in range(n_contests)
+    ]
+
+
+def build_model_contests(n_contests: int, n_participants: int) -> list:
+    return [
+        Contest(
+            id=i,
+            creator_id=i,
+            title=f"Contest {i}",
+            stake_amount=10,
+            start_date=START_DATE,
+            end_date=END_DATE,
+            schedule=Schedule(type="daily", distance=5, required_mask=(1 << 30) - 1),
+            participants=[
+                Participant(id=i * n_participants + j, name=f"Athlete {j}")
+                for j in range(n_participants)
+            ],
+        )
+        for i in range(n_contests)
+    ]
+
+
+def measure_memory(build, *args) -> tuple:
+    """
+        Return the objects built and the memory they use in bytes
+    """
+    gc.collect()
+    tracemalloc.start()
+    objects = build(*args)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return objects, memory
+
+
+def change_participants(contests: list, n_changed: int) -> None:
+    """
+        Change the first participants of every contest, as a verification (one
+        participant) or a settlement (all of them) does
+    """
+    for contest in contests:
+        for participant in contest.participants[:n_changed]:
+            participant.completed_days += 1
+        contest.touch()
+
+
+def measure_time(function) -> float:
+    start_time = time.perf_counter()
+    function()
+    return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--contests", type=int, default=10000)
+    parser.add_argument("--participants", type=int, default=50)
+    args = parser.parse_args()
+
+    dict_contests, dict_memory = measure_memory(build_dict_contests, args.contests, args.participants)
+    dict_encode = measure_time(lambda: json.dumps(dict_contests).encode())
+    del dict_contests
+
+    model_contests, model_memory = measure_memory(build_model_contests, args.contests, args.participants)
+    model_cold_encode = measure_time(lambda: encode_json(model_contests))
+    model_cached_encode = measure_time(lambda: encode_json(model_contests))
+    change_participants(model_contests, 1)
+    model_one_changed_encode = measure_time(lambda: encode_json(model_contests))
+    change_participants(model_contests, args.participants)
+    model_all_changed_encode = measure_time(lambda: encode_json(model_contests))
+
+    print(f"{args.contests} contests x {args.participants} participants")
+    print(f"memory  dicts: {dict_memory / 2**20:8.1f} MiB   models: {model_memory / 2**20:8.1f} MiB")
+    print(
+        f"encode  dicts: {dict_encode * 1e3:8.1f} ms    models: {model_cold_encode * 1e3:8.1f} ms cold, "
+        f"{model_cached_encode * 1e3:.1f} ms cached"
+    )
+    print(
+        f"re-encode after a change per contest  one participant: {model_one_changed_encode * 1e3:8.1f} ms   "
+        f"all participants: {model_all_changed_encode * 1e3:8.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,18 @@
-from app import create_app
+import os
 
-app = create_app()
+if os.environ.get('PROFILE_STARTUP'):
+    # Report the import time and memory of each module, see startup_profile.py
+    from startup_profile import ImportProfiler
+
+    with ImportProfiler() as profiler:
+        from app import create_app
+
+        app = create_app()
+    print(profiler.report())
+else:
+    from app import create_app
+
+    app = create_app()
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=5001)
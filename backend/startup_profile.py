@@ -0,0 +1,144 @@
+"""
+Profile the cold start of the backend: import time and memory cost of each module
+imported while the app is created.
+
+Usage:
+    python startup_profile.py [--top 30] [--no-memory]
+
+Set PROFILE_STARTUP=1 to print the same report when starting run.py.
+"""
+import argparse
+import importlib.abc
+import os
+import sys
+import time
+import tracemalloc
+
+
+class ProfiledLoader:
+    """
+    Loader wrapping the real loader of a module to time its execution.
+    The real loader is restored on the module before it is executed, so the
+    module never sees the wrapper.
+    """
+
+    def __init__(self, loader, profiler):
+        self.loader = loader
+        self.profiler = profiler
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        module.__loader__ = self.loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self.loader
+
+        self.profiler.enter(module.__name__)
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.profiler.exit(module.__name__)
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    """
+    Class to measure the cost of each import
+        - Cumulative and self import time
+        - Cumulative and self memory allocated (tracemalloc)
+    """
+
+    def __init__(self, trace_memory: bool = True):
+        self.trace_memory = trace_memory
+        self.stack = []
+        self.results = {}
+        self.total_time = 0.0
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        sys.meta_path.insert(0, self)
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.total_time = time.perf_counter() - self.start_time
+        sys.meta_path.remove(self)
+        if self.trace_memory:
+            tracemalloc.stop()
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = ProfiledLoader(spec.loader, self)
+        return spec
+
+    def memory(self) -> int:
+        return tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+
+    def enter(self, name: str) -> None:
+        self.stack.append([name, time.perf_counter(), self.memory(), 0.0, 0])
+
+    def exit(self, name: str) -> None:
+        name, start_time, start_memory, children_time, children_memory = self.stack.pop()
+        cumulative_time = time.perf_counter() - start_time
+        cumulative_memory = self.memory() - start_memory
+        self.results[name] = {
+            "cumulative_time": cumulative_time,
+            "self_time": cumulative_time - children_time,
+            "cumulative_memory": cumulative_memory,
+            "self_memory": cumulative_memory - children_memory,
+        }
+        if self.stack:
+            self.stack[-1][3] += cumulative_time
+            self.stack[-1][4] += cumulative_memory
+
+    def report(self, top: int = 30) -> str:
+        """
+            Return the report of the most expensive modules sorted by cumulative time
+        """
+        lines = [
+            f"Startup: {self.total_time * 1e3:.1f} ms, {len(self.results)} modules imported",
+            f"{'cumul ms':>9} {'self ms':>8} {'cumul KiB':>10} {'self KiB':>9}  module",
+        ]
+        ranking = sorted(
+            self.results.items(), key=lambda item: item[1]["cumulative_time"], reverse=True
+        )
+        for name, result in ranking[:top]:
+            lines.append(
+                f"{result['cumulative_time'] * 1e3:9.1f} {result['self_time'] * 1e3:8.1f} "
+                f"{result['cumulative_memory'] / 1024:10.1f} {result['self_memory'] / 1024:9.1f}  {name}"
+            )
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=30, help="Number of modules in the report")
+    parser.add_argument("--no-memory", action="store_true", help="Do not trace the memory, faster")
+    args = parser.parse_args()
+
+    # Never resume nor send the pending description writes from a profiling process
+    os.environ["STAMP_ACTIVITY_DESCRIPTIONS"] = "0"
+
+    with ImportProfiler(trace_memory=not args.no_memory) as profiler:
+        from app import create_app
+
+        create_app()
+
+    print(profiler.report(top=args.top))
+
+
+if __name__ == "__main__":
+    main()
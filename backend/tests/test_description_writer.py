@@ -0,0 +1,221 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from app.description_writer import (
+    MAX_ATTEMPTS,
+    DescriptionWriteQueue,
+    merge_stamp,
+)
+from app.strava_manager import StravaRateLimit, StravaRequestError
+from app.tokens import TokenStore
+
+WINDOW_SECONDS = 900
+DAY_SECONDS = 86400
+
+
+class FakeSend:
+    """Record the writes, raise the queued errors"""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.calls = []
+
+    def __call__(self, athlete_id, activity_id, contest_id, stamp):
+        self.calls.append((athlete_id, activity_id, contest_id, stamp))
+        if self.errors:
+            raise self.errors.pop(0)
+        return {}
+
+
+class BlockedRateLimit(StravaRateLimit):
+    def delay(self, now, requests=1):
+        return 3600.0
+
+
+class ManualQueue(DescriptionWriteQueue):
+    """Queue without worker thread, the tests call process_next"""
+
+    def start(self):
+        pass
+
+
+def make_queue(send, **kwargs) -> ManualQueue:
+    kwargs.setdefault("writes_per_window", 50)
+    kwargs.setdefault("window_seconds", WINDOW_SECONDS)
+    kwargs.setdefault("rate_limit", StravaRateLimit())
+    return ManualQueue(send=send, **kwargs)
+
+
+class MergeStampTest(unittest.TestCase):
+    def test_keeps_the_athlete_text_and_other_contests(self):
+        description = "my run\nBetOnRun - 1: Contest A: 3 days"
+        merged = merge_stamp(description, 2, "BetOnRun - 2: Contest B: 1 days")
+        self.assertEqual(merged, "my run\nBetOnRun - 1: Contest A: 3 days\nBetOnRun - 2: Contest B: 1 days")
+
+    def test_replaces_the_stamp_of_the_contest(self):
+        description = "my run\nBetOnRun - 1: Contest A: 3 days\n"
+        merged = merge_stamp(description, 1, "BetOnRun - 1: Contest A: 4 days")
+        self.assertEqual(merged, "my run\nBetOnRun - 1: Contest A: 4 days")
+
+    def test_empty_description(self):
+        self.assertEqual(merge_stamp("", 1, "BetOnRun - 1: x"), "BetOnRun - 1: x")
+
+
+class QueueTest(unittest.TestCase):
+    def test_coalesces_per_activity_and_contest(self):
+        queue = make_queue(FakeSend())
+        queue.enqueue(7, 100, 1, "1 days")
+        queue.enqueue(7, 100, 1, "2 days")
+        queue.enqueue(7, 100, 2, "1 days")
+        self.assertEqual(len(queue.pending), 2)
+        self.assertEqual(queue.pending[(100, 1)]["stamp"], "BetOnRun - 1: 2 days")
+        self.assertEqual(queue.get_metrics()["coalesced"], 1)
+
+    def test_stamp_is_a_single_line(self):
+        queue = make_queue(FakeSend())
+        queue.enqueue(7, 100, 1, "Contest\nA")
+        self.assertEqual(queue.pending[(100, 1)]["stamp"], "BetOnRun - 1: Contest A")
+
+    def test_writes_are_paced(self):
+        send = FakeSend()
+        queue = make_queue(send)
+        queue.enqueue(7, 100, 1, "a")
+        queue.enqueue(7, 101, 1, "b")
+        self.assertTrue(queue.process_next(now=1000.0))
+        self.assertFalse(queue.process_next(now=1001.0))
+        self.assertTrue(queue.process_next(now=1000.0 + queue.interval))
+        self.assertEqual([call[1] for call in send.calls], [100, 101])
+        self.assertEqual(send.calls[0][0], 7)
+
+    def test_daily_budget(self):
+        queue = make_queue(FakeSend(), writes_per_day=2, day_seconds=DAY_SECONDS)
+        for activity_id in range(3):
+            queue.enqueue(7, activity_id, 1, "a")
+        now = 10 * DAY_SECONDS
+        self.assertTrue(queue.process_next(now=now))
+        self.assertTrue(queue.process_next(now=now + queue.interval))
+        self.assertFalse(queue.process_next(now=now + 2 * queue.interval))
+        self.assertTrue(queue.process_next(now=11 * DAY_SECONDS))
+
+    def test_waits_for_the_rate_limit_headers(self):
+        rate_limit = StravaRateLimit()
+        now = 10 * DAY_SECONDS + 60
+        rate_limit.update({"X-RateLimit-Limit": "200,2000", "X-RateLimit-Usage": "10,1999"}, now=now)
+        queue = make_queue(FakeSend(), rate_limit=rate_limit)
+        queue.enqueue(7, 100, 1, "a")
+        self.assertFalse(queue.process_next(now=now))
+        self.assertEqual(queue.next_write_at, 11 * DAY_SECONDS)
+        self.assertTrue(queue.process_next(now=11 * DAY_SECONDS))
+
+    def test_transient_failure_is_retried_with_backoff(self):
+        send = FakeSend([StravaRequestError("Error: 503", 503)])
+        queue = make_queue(send)
+        queue.enqueue(7, 100, 1, "a")
+        self.assertTrue(queue.process_next(now=1000.0))
+        write = queue.pending[(100, 1)]
+        self.assertEqual(write["attempts"], 1)
+        self.assertGreater(write["next_attempt_at"], 1000.0 + queue.interval)
+        self.assertTrue(queue.process_next(now=write["next_attempt_at"]))
+        self.assertEqual(queue.get_metrics()["sent"], 1)
+
+    def test_unexpected_error_is_retried(self):
+        queue = make_queue(FakeSend([KeyError("description")]))
+        queue.enqueue(7, 100, 1, "a")
+        self.assertTrue(queue.process_next(now=1000.0))
+        self.assertIn((100, 1), queue.pending)
+        self.assertEqual(queue.in_flight, {})
+
+    def test_permanent_failure_is_dropped(self):
+        queue = make_queue(FakeSend([StravaRequestError("Error: 404", 404)]))
+        queue.enqueue(7, 100, 1, "a")
+        self.assertTrue(queue.process_next(now=1000.0))
+        self.assertEqual(len(queue.pending), 0)
+        self.assertEqual(queue.get_metrics()["failed"], 1)
+
+    def test_gives_up_after_max_attempts(self):
+        send = FakeSend([StravaRequestError("Error", None)] * MAX_ATTEMPTS)
+        queue = make_queue(send)
+        queue.enqueue(7, 100, 1, "a")
+        now = 1000.0
+        while queue.pending:
+            now = max(now, queue.next_delay(now) + now)
+            queue.process_next(now=now)
+        self.assertEqual(len(send.calls), MAX_ATTEMPTS)
+        self.assertEqual(queue.get_metrics()["failed"], 1)
+
+    def test_rate_limited_write_keeps_its_attempts(self):
+        queue = make_queue(FakeSend([StravaRequestError("Error: 429", 429)]))
+        queue.enqueue(7, 100, 1, "a")
+        self.assertTrue(queue.process_next(now=1000.0))
+        self.assertEqual(queue.pending[(100, 1)]["attempts"], 0)
+        self.assertEqual(queue.next_write_at, 1000.0 + WINDOW_SECONDS)
+        self.assertEqual(queue.get_metrics()["rate_limited"], 1)
+
+
+class PersistenceTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.template = os.path.join(self.directory.name, "queue.{pid}.json")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_pending_writes_are_saved_without_tokens(self):
+        queue = make_queue(FakeSend(), path=self.template)
+        queue.enqueue(7, 100, 1, "a")
+        queue.flush(force=True)
+        with open(queue.path) as f:
+            writes = json.load(f)
+        self.assertEqual([(w["athlete_id"], w["activity_id"], w["contest_id"]) for w in writes], [(7, 100, 1)])
+        self.assertNotIn("access_token", writes[0])
+        self.assertEqual(os.stat(queue.path).st_mode & 0o777, 0o600)
+
+    def test_files_of_dead_processes_are_resumed(self):
+        process = subprocess.Popen([sys.executable, "-c", "pass"])
+        process.wait()
+        with open(self.template.format(pid=process.pid), "w") as f:
+            json.dump([{
+                "athlete_id": 7, "activity_id": 100, "contest_id": 1,
+                "stamp": "BetOnRun - 1: a", "attempts": 0, "next_attempt_at": 0.0,
+            }], f)
+
+        queue = make_queue(FakeSend(), path=self.template, rate_limit=BlockedRateLimit())
+        self.assertIn((100, 1), queue.pending)
+        self.assertEqual(os.listdir(self.directory.name), [os.path.basename(queue.path)])
+
+    def test_files_of_running_processes_are_left(self):
+        path = self.template.format(pid=1)
+        with open(path, "w") as f:
+            json.dump([], f)
+        queue = make_queue(FakeSend(), path=self.template)
+        self.assertEqual(len(queue.pending), 0)
+        self.assertTrue(os.path.exists(path))
+
+
+class TokenStoreTest(unittest.TestCase):
+    def test_refreshes_an_expiring_token(self):
+        refreshed = []
+
+        def refresh(client_id, client_secret, refresh_token):
+            refreshed.append(refresh_token)
+            return {"access_token": "new", "refresh_token": "r2", "expires_at": 20000}
+
+        tokens = TokenStore(refresh=refresh)
+        tokens.set(7, "old", "r1", 10000)
+        self.assertEqual(tokens.get_access_token(7, now=1000), "old")
+        self.assertEqual(tokens.get_access_token(7, now=9900), "new")
+        self.assertEqual(refreshed, ["r1"])
+        self.assertEqual(tokens.get_access_token(7, now=9900), "new")
+
+    def test_missing_token_is_transient(self):
+        with self.assertRaises(StravaRequestError) as context:
+            TokenStore().get_access_token(7)
+        self.assertIsNone(context.exception.status_code)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import importlib.util
+import unittest
+from datetime import date, timedelta
+
+from app.models import Schedule
+from app.schedule import CompiledSchedule, compile_required_mask
+
+START_DATE = date(2024, 1, 1)  # Monday
+DURATION_DAYS = 30
+
+
+def compile_schedule(schedule_type="daily", days=None) -> CompiledSchedule:
+    schedule = Schedule(type=schedule_type, distance=5, days=days)
+    required_mask = compile_required_mask(schedule, START_DATE, DURATION_DAYS)
+    return CompiledSchedule(START_DATE, DURATION_DAYS, required_mask)
+
+
+def completed_mask(*days: int) -> int:
+    mask = 0
+    for i in days:
+        mask |= 1 << i
+    return mask
+
+
+def day(i: int) -> date:
+    return START_DATE + timedelta(days=i)
+
+
+class CompileRequiredMaskTest(unittest.TestCase):
+    def test_daily(self):
+        self.assertEqual(compile_schedule().required_mask, (1 << DURATION_DAYS) - 1)
+
+    def test_weekly(self):
+        compiled = compile_schedule("weekly", ["Monday", "wednesday"])
+        self.assertTrue(compiled.is_required(day(0)))
+        self.assertFalse(compiled.is_required(day(1)))
+        self.assertTrue(compiled.is_required(day(2)))
+        self.assertTrue(compiled.is_required(day(7)))
+
+    def test_unknown_type(self):
+        with self.assertRaises(ValueError):
+            compile_schedule("monthly")
+
+
+class StreakTest(unittest.TestCase):
+    def test_day_in_progress_does_not_break_the_streak(self):
+        compiled = compile_schedule()
+        mask = completed_mask(0, 1, 2, 3, 4)
+        self.assertEqual(compiled.streak(mask, day(5)), 5)
+        self.assertEqual(compiled.streak(mask | 1 << 5, day(5)), 6)
+
+    def test_missed_day_breaks_the_streak(self):
+        compiled = compile_schedule()
+        mask = completed_mask(0, 1, 2, 3, 4)
+        # Day 5 was missed, day 6 is in progress
+        self.assertEqual(compiled.streak(mask, day(6)), 0)
+        self.assertEqual(compiled.streak(mask | 1 << 6, day(6)), 1)
+
+    def test_missed_first_day(self):
+        compiled = compile_schedule()
+        self.assertEqual(compiled.streak(0, day(0)), 0)
+        self.assertEqual(compiled.streak(completed_mask(1, 2, 3), day(3)), 3)
+        self.assertEqual(compiled.streak(completed_mask(1, 2, 3), day(4)), 3)
+
+    def test_days_not_required_do_not_break_the_streak(self):
+        compiled = compile_schedule("weekly", ["monday", "wednesday"])
+        # Mondays 0 and 7, Wednesday 2
+        self.assertEqual(compiled.streak(completed_mask(0, 2, 7), day(8)), 3)
+
+    def test_before_the_start(self):
+        compiled = compile_schedule()
+        self.assertEqual(compiled.streak(0, START_DATE - timedelta(days=1)), 0)
+
+
+class MissedDaysTest(unittest.TestCase):
+    def test_day_in_progress_is_not_missed(self):
+        compiled = compile_schedule()
+        self.assertEqual(compiled.missed_days(completed_mask(0, 1, 2), day(3)), 0)
+
+    def test_missed_first_day(self):
+        compiled = compile_schedule()
+        self.assertEqual(compiled.missed_days(0, day(0)), 0)
+        self.assertEqual(compiled.missed_days(completed_mask(1, 2), day(3)), 1)
+
+    def test_after_the_end(self):
+        compiled = compile_schedule()
+        self.assertEqual(compiled.missed_days(completed_mask(0), day(DURATION_DAYS + 10)), DURATION_DAYS - 1)
+
+
+@unittest.skipIf(importlib.util.find_spec("numpy") is None, "settle requires numpy")
+class SettleTest(unittest.TestCase):
+    def test_settle(self):
+        compiled = compile_schedule()
+        every_day = (1 << DURATION_DAYS) - 1
+        results = compiled.settle([every_day, every_day & ~1, 0])
+
+        self.assertEqual([r["completed_days"] for r in results], [30, 29, 0])
+        self.assertEqual([r["missed_days"] for r in results], [0, 1, 30])
+        self.assertEqual([r["passed"] for r in results], [True, False, False])
+        self.assertAlmostEqual(results[1]["completion_pct"], 100.0 * 29 / 30)
+
+    def test_days_not_required_are_ignored(self):
+        compiled = compile_schedule("weekly", ["monday"])
+        mondays = compiled.required_mask
+        results = compiled.settle([mondays | completed_mask(1, 2), completed_mask(1, 2)])
+
+        self.assertEqual(results[0]["completed_days"], 5)
+        self.assertTrue(results[0]["passed"])
+        self.assertEqual(results[1]["completed_days"], 0)
+        self.assertEqual(results[1]["missed_days"], 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import base64
+import math
+import unittest
+from array import array
+
+from app.streams import MAX_ENCODED_VALUE, encode_deltas, minmax_buckets
+
+
+def decode_deltas(encoded: dict) -> list:
+    deltas = array("i", base64.b64decode(encoded["data"]))
+    values, current = [], 0
+    for delta in deltas:
+        current += delta
+        values.append(current)
+    return values
+
+
+class MinmaxBucketsTest(unittest.TestCase):
+    def test_keeps_the_budget(self):
+        values = [math.sin(i / 10) for i in range(1000)]
+        for target_points in range(2, 50):
+            kept = minmax_buckets(values, target_points)
+            self.assertLessEqual(len(kept), target_points)
+            self.assertEqual(kept[0], 0)
+            self.assertEqual(kept[-1], len(values) - 1)
+
+    def test_keeps_the_peaks(self):
+        values = [0.0] * 100
+        values[37], values[62] = 10.0, -10.0
+        kept = minmax_buckets(values, 10)
+        self.assertIn(37, kept)
+        self.assertIn(62, kept)
+
+    def test_short_series(self):
+        self.assertEqual(minmax_buckets([1, 2, 3], 10), [0, 1, 2])
+
+
+class EncodeDeltasTest(unittest.TestCase):
+    def test_round_trip(self):
+        self.assertEqual(decode_deltas(encode_deltas([5.25, 4.5, None, 6], scale=100)), [525, 450, 450, 600])
+
+    def test_out_of_range_values_are_skipped(self):
+        values = [1.0, 1e9, math.inf, math.nan, -1e9, 2.0]
+        self.assertEqual(decode_deltas(encode_deltas(values, scale=100)), [100, 100, 100, 100, 100, 200])
+
+    def test_extreme_values_fit(self):
+        values = [MAX_ENCODED_VALUE, -MAX_ENCODED_VALUE, MAX_ENCODED_VALUE]
+        self.assertEqual(decode_deltas(encode_deltas(values)), values)
+
+
+if __name__ == "__main__":
+    unittest.main()